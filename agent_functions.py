@@ -6,7 +6,10 @@ Este módulo expone funciones listas para usar que NO requieren implementación
 from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import PromptTemplate
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Annotated, TypedDict
+import operator
+import math
+import time
 import json
 
 from .src import CodeAgent
@@ -20,13 +23,14 @@ class AgentFunctions:
     Para usar en LangGraph: instanciar esta clase y usar sus métodos como nodos del grafo.
     """
     
-    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.0):
+    def __init__(self, model: str = "gpt-4o-mini", temperature: float = 0.0, max_concurrency: int = 8):
         """
         Inicializa las funciones del agente.
         
         Args:
             model: Modelo de OpenAI a usar
             temperature: Temperatura del modelo (0.0 = determinístico)
+            max_concurrency: Llamadas simultáneas al modelo en las funciones batch
         """
         # Configurar LangChain
         self.llm = ChatOpenAI(model=model, temperature=temperature)
@@ -37,6 +41,8 @@ class AgentFunctions:
         
         # Agente actual
         self.current_agent: CodeAgent = None
+        
+        self.max_concurrency = max_concurrency
     
     # =========================================================================
     # FUNCIÓN 1: Inicializar Agente Base
@@ -347,6 +353,281 @@ class AgentFunctions:
         }
 
 
+    # =========================================================================
+    # FUNCIÓN 8: Generar Código en Lote (async)
+    # =========================================================================
+    
+    async def generate_code_batch(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Genera parches para varias instancias a la vez con el agente actual.
+        Las llamadas comparten self.chain y corren en paralelo con un máximo
+        de max_concurrency simultáneas. Un error en una instancia no detiene
+        al resto: queda registrado en "errors".
+        
+        Input state (requerido):
+            - instances: List[dict] (cada una con instance_id, repo,
+              problem_statement, test_patch)
+            - max_concurrency: int (opcional, por defecto el de la instancia)
+        
+        Output state:
+            - predictions: List[dict] (instance_id, model_patch, model_name),
+              una por instancia y en el mismo orden; model_patch vacío si falló
+            - errors: List[dict] (instance_id, error)
+            - message: str
+        
+        Uso en LangGraph:
+            graph.add_node("generate_batch", agent_functions.generate_code_batch)
+        """
+        instances = state.get("instances", [])
+        model_name = f"model-{self.current_agent.id}"
+        prompt_template = (
+            self.current_agent.prompt_template 
+            if self.current_agent.prompt_template 
+            else PromptTemplate.from_template(self.current_agent.prompt)
+        )
+        
+        # Instancias sin los campos requeridos fallan aquí, sin llamar al modelo
+        inputs, positions, errors = [], [], []
+        for i, instance in enumerate(instances):
+            try:
+                inputs.append({
+                    "repo": instance["repo"],
+                    "problem_statement": instance["problem_statement"],
+                    "test_patch": instance["test_patch"]
+                })
+                positions.append(i)
+            except KeyError as e:
+                errors.append({"instance_id": instance.get("instance_id"), "error": f"Missing field {e}"})
+        
+        results = await (prompt_template | self.chain).abatch(
+            inputs,
+            config={"max_concurrency": state.get("max_concurrency", self.max_concurrency)},
+            return_exceptions=True
+        )
+        codes = dict(zip(positions, results))
+        
+        predictions = []
+        for i, instance in enumerate(instances):
+            code = codes.get(i)
+            if isinstance(code, Exception):
+                errors.append({"instance_id": instance.get("instance_id"), "error": str(code)})
+            predictions.append({
+                "instance_id": instance.get("instance_id"),
+                "model_patch": code if isinstance(code, str) else "",
+                "model_name": model_name
+            })
+        
+        return {
+            **state,
+            "predictions": predictions,
+            "errors": errors,
+            "message": f"✓ Código generado para {len(instances) - len(errors)}/{len(instances)} instancias"
+        }
+    
+    # =========================================================================
+    # FUNCIÓN 9: Analizar Errores en Lote (async)
+    # =========================================================================
+    
+    async def analyze_errors_batch(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Versión en lote de analyze_errors: analiza varias instancias fallidas
+        en paralelo (máximo max_concurrency llamadas simultáneas). Las
+        respuestas que no son JSON válido se registran en "errors".
+        
+        Input state (requerido):
+            - failures: List[dict] (cada uno con los campos de analyze_errors:
+              instance_id, problem_statement, test_patch, predicted_patch,
+              agent_patch_log, correct_patch)
+            - max_concurrency: int (opcional)
+        
+        Output state:
+            - analyses: List[dict] (solo los análisis válidos; listo para
+              consolidate_analysis)
+            - errors: List[dict] (instance_id, error)
+            - message: str
+        
+        Uso en LangGraph:
+            graph.add_node("analyze_batch", agent_functions.analyze_errors_batch)
+        """
+        failures = state.get("failures", [])
+        
+        inputs, ids, errors = [], [], []
+        for failure in failures:
+            try:
+                inputs.append({
+                    "problem_statement": failure["problem_statement"],
+                    "test_patch": failure["test_patch"],
+                    "predicted_patch": failure["predicted_patch"],
+                    "agent_patch_log": failure["agent_patch_log"],
+                    "patch": failure["correct_patch"]
+                })
+                ids.append(failure.get("instance_id"))
+            except KeyError as e:
+                errors.append({"instance_id": failure.get("instance_id"), "error": f"Missing field {e}"})
+        
+        results = await (TASK_IMPROVEMENT_REASONER | self.chain).abatch(
+            inputs,
+            config={"max_concurrency": state.get("max_concurrency", self.max_concurrency)},
+            return_exceptions=True
+        )
+        
+        analyses = []
+        for instance_id, result in zip(ids, results):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                analysis = json.loads(result.strip())
+                analyses.append({"instance_id": instance_id, **analysis})
+            except Exception as e:
+                errors.append({"instance_id": instance_id, "error": str(e)})
+        
+        return {
+            **state,
+            "analyses": analyses,
+            "errors": errors,
+            "message": f"✓ Análisis completados: {len(analyses)}/{len(failures)}"
+        }
+
+
+# ============================================================================
+# GRAFO MAP-REDUCE (Send)
+# ============================================================================
+
+class MapReduceState(TypedDict, total=False):
+    instances: List[Dict]
+    max_concurrency: int
+    predictions: Annotated[List[Dict], operator.add]
+    failures: List[Dict]
+    analyses: Annotated[List[Dict], operator.add]
+    errors: Annotated[List[Dict], operator.add]
+    consolidated_analysis: str
+    num_improvements: int
+
+
+def _chunks(items: List, size: int) -> List[List]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def build_map_reduce_graph(agent_functions: AgentFunctions, evaluate=None, chunk_size: int = 8, max_concurrency: int = None):
+    """
+    Grafo map-reduce sobre las funciones batch.
+    
+    Flujo:
+        START -> generate (un Send por bloque de chunk_size instancias)
+              -> evaluate -> analyze (un Send por bloque de fallos)
+              -> consolidate -> END
+    
+    Args:
+        agent_functions: Instancia de AgentFunctions con agente actual
+        evaluate: Función opcional predictions -> failures (lista de dicts
+            con los campos de analyze_errors). Sin ella el grafo termina
+            después de generar.
+        chunk_size: Instancias por rama del map
+        max_concurrency: Llamadas simultáneas al modelo en todo el map (por
+            defecto agent_functions.max_concurrency)
+    
+    Returns:
+        Grafo compilado (usar con await graph.ainvoke({"instances": [...]}))
+    """
+    from langgraph.graph import StateGraph, START, END
+    from langgraph.types import Send
+    
+    max_concurrency = max_concurrency or agent_functions.max_concurrency
+    
+    # Las ramas del map corren en el mismo paso: el límite total se reparte
+    # entre ellas, y el grafo no corre más de max_concurrency ramas a la vez
+    def lane_concurrency(items):
+        lanes = max(1, math.ceil(len(items) / chunk_size))
+        return max(1, max_concurrency // lanes)
+    
+    # Los nodos del map solo devuelven las claves con reducer: el resto del
+    # estado ya está en el grafo y escribirlo desde varias ramas sería un conflicto
+    async def generate(chunk_state):
+        result = await agent_functions.generate_code_batch(chunk_state)
+        return {"predictions": result["predictions"], "errors": result["errors"]}
+    
+    async def analyze(chunk_state):
+        result = await agent_functions.analyze_errors_batch(chunk_state)
+        return {"analyses": result["analyses"], "errors": result["errors"]}
+    
+    def run_evaluate(state):
+        return {"failures": evaluate(state.get("predictions", []))}
+    
+    def consolidate(state):
+        result = agent_functions.consolidate_analysis({"analyses": state.get("analyses", [])})
+        return {
+            "consolidated_analysis": result["consolidated_analysis"],
+            "num_improvements": result["num_improvements"]
+        }
+    
+    after_generate = "evaluate" if evaluate else END
+    
+    def map_instances(state):
+        instances = state.get("instances", [])
+        sends = [
+            Send("generate", {"instances": chunk, "max_concurrency": lane_concurrency(instances)})
+            for chunk in _chunks(instances, chunk_size)
+        ]
+        return sends or after_generate
+    
+    def map_failures(state):
+        failures = state.get("failures", [])
+        sends = [
+            Send("analyze", {"failures": chunk, "max_concurrency": lane_concurrency(failures)})
+            for chunk in _chunks(failures, chunk_size)
+        ]
+        return sends or "consolidate"
+    
+    graph = StateGraph(MapReduceState)
+    graph.add_node("generate", generate)
+    graph.add_conditional_edges(START, map_instances, ["generate", after_generate])
+    graph.add_edge("generate", after_generate)
+    
+    if evaluate:
+        graph.add_node("evaluate", run_evaluate)
+        graph.add_node("analyze", analyze)
+        graph.add_node("consolidate", consolidate)
+        graph.add_conditional_edges("evaluate", map_failures, ["analyze", "consolidate"])
+        graph.add_edge("analyze", "consolidate")
+        graph.add_edge("consolidate", END)
+    
+    return graph.compile().with_config({"max_concurrency": max_concurrency})
+
+
+async def benchmark_fan_out(agent_functions: AgentFunctions, instances: List[Dict], max_concurrency: int = 8) -> Dict[str, float]:
+    """
+    Compara la generación de parches para `instances` con el nodo
+    secuencial (generate_code, una instancia tras otra), con
+    generate_code_batch y con el grafo map-reduce.
+    
+    Returns:
+        Dict con los segundos de cada modo y el speedup frente al secuencial
+    """
+    timings = {}
+    
+    start = time.perf_counter()
+    for instance in instances:
+        await agent_functions.generate_code(dict(instance))
+    timings["sequential"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    await agent_functions.generate_code_batch({"instances": instances, "max_concurrency": max_concurrency})
+    timings["batch"] = time.perf_counter() - start
+    
+    # Mismo límite de llamadas simultáneas que el modo batch
+    graph = build_map_reduce_graph(agent_functions, max_concurrency=max_concurrency)
+    start = time.perf_counter()
+    await graph.ainvoke({"instances": instances})
+    timings["map_reduce"] = time.perf_counter() - start
+    
+    for mode in ("batch", "map_reduce"):
+        timings[f"{mode}_speedup"] = round(timings["sequential"] / timings[mode], 2) if timings[mode] else None
+    
+    for mode, value in timings.items():
+        print(f"{mode:20s} {value:.3f}" if isinstance(value, float) else f"{mode:20s} {value}")
+    return timings
+
+
 # ============================================================================
 # FUNCIONES AUXILIARES (sin estado, puras)
 # ============================================================================
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import uuid
+import shutil
+
+# ---------------------------------------------------------------------
+# EJECUCIÓN EN BATCH (formato OpenAI Batch API)
+# ---------------------------------------------------------------------
+# Cada etapa del grafo (coders, evaluador) escribe sus peticiones en un JSONL,
+# lo envía a un backend y guarda un registro "pending" en BATCH_DIR. El grafo
+# se pausa hasta que el backend termina; al reanudar se unen los resultados
+# por custom_id.
+
+BATCH_DIR = "batches"
+ENDPOINT = "/v1/chat/completions"
+
+
+def build_request(custom_id, prompt, model="gpt-4o-mini", **params):
+    """Una línea del JSONL de entrada del Batch API."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": ENDPOINT,
+        "body": {"model": model, "messages": [{"role": "user", "content": prompt}], **params},
+    }
+
+
+def write_batch_file(requests, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        for request in requests:
+            f.write(json.dumps(request) + "\n")
+    return path
+
+
+def read_jsonl(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def extract_content(result):
+    """Texto de la respuesta de una línea de salida, o None si la petición falló."""
+    response = result.get("response") or {}
+    if result.get("error") or response.get("status_code") != 200:
+        return None
+    return response["body"]["choices"][0]["message"]["content"]
+
+
+class LocalBatchBackend:
+    """
+    Backend en disco para pruebas: el batch queda 'in_progress' hasta que
+    aparece output.jsonl en su carpeta. `complete` lo genera con un responder
+    (función body -> texto) en lugar de llamar a la API.
+    """
+
+    def __init__(self, root=os.path.join(BATCH_DIR, "local")):
+        self.root = root
+
+    def submit(self, path):
+        batch_id = "batch_local_" + uuid.uuid4().hex[:12]
+        os.makedirs(os.path.join(self.root, batch_id))
+        shutil.copy(path, os.path.join(self.root, batch_id, "input.jsonl"))
+        return batch_id
+
+    def status(self, batch_id):
+        if os.path.exists(os.path.join(self.root, batch_id, "output.jsonl")):
+            return "completed"
+        return "in_progress"
+
+    def results(self, batch_id):
+        return read_jsonl(os.path.join(self.root, batch_id, "output.jsonl"))
+
+    def complete(self, batch_id, responder):
+        lines = []
+        for request in read_jsonl(os.path.join(self.root, batch_id, "input.jsonl")):
+            content = responder(request["body"])
+            lines.append({
+                "id": "batch_req_" + uuid.uuid4().hex[:12],
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]},
+                },
+                "error": None,
+            })
+        write_batch_file(lines, os.path.join(self.root, batch_id, "output.jsonl"))
+
+
+class OpenAIBatchBackend:
+    """Backend real sobre la Batch API de OpenAI."""
+
+    def __init__(self):
+        from openai import OpenAI
+        self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+
+    def submit(self, path):
+        with open(path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=ENDPOINT,
+            completion_window="24h"
+        )
+        return batch.id
+
+    def status(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        # expired/cancelled también tienen salida parcial que se puede unir
+        if batch.status in ("completed", "expired", "cancelled"):
+            return "completed"
+        if batch.status == "failed":
+            # Rechazado al validar el archivo de entrada: no hay salida que esperar
+            print(f"Batch {batch_id} failed: {batch.errors}")
+        return batch.status
+
+    def results(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        lines = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                text = self.client.files.content(file_id).text
+                lines.extend(json.loads(line) for line in text.splitlines() if line.strip())
+        return lines
+
+
+BACKENDS = {
+    "local": LocalBatchBackend,
+    "openai": OpenAIBatchBackend,
+}
+
+
+def get_backend(name):
+    return BACKENDS[name]()
+
+
+def _pending_path(stage):
+    return os.path.join(BATCH_DIR, stage + ".pending.json")
+
+
+def pending_batch(stage):
+    """Registro del batch pendiente de una etapa, o None."""
+    if not os.path.exists(_pending_path(stage)):
+        return None
+    with open(_pending_path(stage), "r") as f:
+        return json.load(f)
+
+
+def submit_stage(stage, requests, backend_name):
+    """Escribe el JSONL de la etapa, lo envía y guarda el registro pendiente."""
+    path = write_batch_file(requests, os.path.join(BATCH_DIR, f"{stage}.{int(time.time())}.jsonl"))
+    batch_id = get_backend(backend_name).submit(path)
+    record = {"stage": stage, "backend": backend_name, "batch_id": batch_id, "input": path, "requests": len(requests)}
+    with open(_pending_path(stage), "w") as f:
+        json.dump(record, f)
+    print(f"Batch {batch_id} submitted for {stage} ({len(requests)} requests).")
+    return record
+
+
+def collect_stage(stage):
+    """
+    Consulta el batch pendiente de la etapa. Devuelve {custom_id: texto o None}
+    si terminó (y borra el registro) o None si sigue en curso. Un batch
+    "failed" no tiene salida: se borra el registro y se devuelve {} para que
+    los join_*_batch marquen cada petición como fallida.
+    """
+    record = pending_batch(stage)
+    backend = get_backend(record["backend"])
+    status = backend.status(record["batch_id"])
+    if status == "failed":
+        print(f"Batch {record['batch_id']} for {stage} failed, joining it with no results.")
+        os.remove(_pending_path(stage))
+        return {}
+    if status != "completed":
+        print(f"Batch {record['batch_id']} for {stage} is {status}.")
+        return None
+
+    contents = {result["custom_id"]: extract_content(result) for result in backend.results(record["batch_id"])}
+    os.remove(_pending_path(stage))
+    return contents
+
+
+def check_local_batch():
+    """
+    Ciclo completo con LocalBatchBackend en una carpeta temporal: envío,
+    consulta en curso, complete() y unión por custom_id. Devuelve True si todo
+    cuadra.
+    """
+    import tempfile
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            requests = [build_request(f"A::{i}", f"prompt {i}") for i in range(3)]
+            record = submit_stage("check", requests, "local")
+            in_progress = collect_stage("check") is None
+            LocalBatchBackend().complete(record["batch_id"], lambda body: body["messages"][0]["content"].upper())
+            contents = collect_stage("check")
+            cleared = pending_batch("check") is None
+        finally:
+            os.chdir(cwd)
+
+    ok = in_progress and cleared and contents == {f"A::{i}": f"PROMPT {i}" for i in range(3)}
+    print(f"Local batch check: {'OK' if ok else 'FAILED'}")
+    return ok
+
+
+def wait_stage(stage, poll_interval=60, timeout=None):
+    """Espera bloqueando hasta que termine el batch de la etapa."""
+    start = time.time()
+    while True:
+        contents = collect_stage(stage)
+        if contents is not None:
+            return contents
+        if timeout is not None and time.time() - start > timeout:
+            return None
+        time.sleep(poll_interval)
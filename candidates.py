@@ -0,0 +1,232 @@
+import os
+import re
+import json
+import hashlib
+import subprocess
+import tempfile
+
+from eval_reports import resolved_ids
+
+# ---------------------------------------------------------------------
+# CANDIDATOS MÚLTIPLES POR AGENTE
+# ---------------------------------------------------------------------
+# Con n muestras por instancia, el candidato k-ésimo (único y válido) de cada
+# instancia se escribe en predictions/<model>-s<k>.json; el candidato 0 sigue
+# yendo a predictions/<model>.json para que el resto del ciclo no cambie.
+
+HUNK_RE = re.compile(r"^@@ -\d+(?:,(\d+))? \+\d+(?:,(\d+))? @@")
+
+
+def sample_model_name(model, k):
+    return model if k == 0 else f"{model}-s{k}"
+
+
+def manifest_path(model):
+    return "predictions/" + model + ".candidates.json"
+
+
+def normalize_patch(patch):
+    """Normaliza un diff para comparar candidatos (ignora CRLF, líneas index y espacios finales)."""
+    lines = []
+    for line in patch.replace("\r\n", "\n").split("\n"):
+        if line.startswith("index "):
+            continue
+        lines.append(line.rstrip())
+    return "\n".join(lines).strip() + "\n"
+
+
+def patch_hash(patch):
+    return hashlib.sha256(normalize_patch(patch).encode()).hexdigest()[:16]
+
+
+def check_hunks(patch):
+    """
+    Comprueba que cada hunk tenga tantas líneas como declara su cabecera. El
+    último hunk puede quedarse corto solo en líneas de contexto finales.
+    """
+    lines = patch.split("\n")
+    i = 0
+    n_hunks = 0
+    while i < len(lines):
+        match = HUNK_RE.match(lines[i])
+        if not match:
+            i += 1
+            continue
+        n_hunks += 1
+        old_left = int(match.group(1) or 1)
+        new_left = int(match.group(2) or 1)
+        i += 1
+        while i < len(lines) and (old_left > 0 or new_left > 0):
+            line = lines[i]
+            if line.startswith("\\"):
+                i += 1
+                continue
+            if line.startswith("-"):
+                old_left -= 1
+            elif line.startswith("+"):
+                new_left -= 1
+            elif line.startswith(" ") or line == "":
+                old_left -= 1
+                new_left -= 1
+            else:
+                break
+            i += 1
+        # parse_task_response hace strip() del diff: al final del parche pueden
+        # faltar líneas de contexto en blanco, que cuentan igual en ambos lados
+        if i == len(lines) and old_left == new_left:
+            continue
+        if old_left != 0 or new_left != 0:
+            return False
+    return n_hunks > 0
+
+
+def git_apply_check(patch, repo, base_commit):
+    """`git apply --check` contra el clon bare de retrieval, sin crear un worktree."""
+    from retrieval import ensure_repo
+
+    repo_path = ensure_repo(repo, base_commit)
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "GIT_INDEX_FILE": os.path.join(tmp, "index")}
+        patch_file = os.path.join(tmp, "candidate.diff")
+        with open(patch_file, "w") as f:
+            f.write(patch if patch.endswith("\n") else patch + "\n")
+        subprocess.run(["git", "-C", repo_path, "read-tree", base_commit], env=env, check=True, capture_output=True)
+        result = subprocess.run(
+            ["git", "-C", repo_path, "apply", "--cached", "--check", os.path.abspath(patch_file)],
+            env=env, capture_output=True, text=True
+        )
+    return result.returncode == 0, result.stderr.strip()
+
+
+def validate_patch(patch, instance=None, apply_check=False):
+    """Devuelve (valid, reason) para un candidato antes de mandarlo a SWE-bench."""
+    if not patch or not patch.strip():
+        return False, "empty patch"
+    if "--- " not in patch or "+++ " not in patch:
+        return False, "missing file headers"
+    if not check_hunks(patch):
+        return False, "malformed hunk"
+    if apply_check and instance is not None:
+        try:
+            ok, error = git_apply_check(patch, instance["repo"], instance["base_commit"])
+        except Exception as e:
+            return True, f"apply check skipped: {e}"
+        if not ok:
+            return False, "does not apply: " + error
+    return True, "ok"
+
+
+def dedup_candidates(patches, instance=None, apply_check=False):
+    """
+    Agrupa los parches por hash normalizado y valida cada uno una sola vez.
+    Devuelve la lista de candidatos únicos en orden de aparición.
+    """
+    unique = {}
+    for patch in patches:
+        key = patch_hash(patch)
+        if key in unique:
+            unique[key]["count"] += 1
+            continue
+        valid, reason = validate_patch(patch, instance, apply_check)
+        unique[key] = {"hash": key, "patch": patch, "count": 1, "valid": valid, "reason": reason}
+    return list(unique.values())
+
+
+def write_candidate_predictions(model, candidates_by_instance):
+    """
+    Escribe un archivo de predicciones por índice de muestra con solo los
+    candidatos únicos y válidos. Si una instancia no tiene ninguno válido, el
+    primero se manda igual en la muestra 0 para que el evaluador tenga log.
+    Devuelve la lista de rutas escritas, empezando por la de la muestra 0.
+    """
+    files = {}
+    manifest = {}
+    for instance_id, candidates in candidates_by_instance.items():
+        valid = [c for c in candidates if c["valid"]]
+        forwarded = valid if valid else candidates[:1]
+        for k, candidate in enumerate(forwarded):
+            name = sample_model_name(model, k)
+            files.setdefault(k, []).append(
+                {"instance_id": instance_id, "model_patch": candidate["patch"], "model_name_or_path": name}
+            )
+            candidate["sample"] = name
+        manifest[instance_id] = [{k: v for k, v in c.items() if k != "patch"} for c in candidates]
+
+    paths = []
+    for k in sorted(files):
+        path = "predictions/" + sample_model_name(model, k) + ".json"
+        with open(path, "w") as f:
+            json.dump(files[k], f)
+        paths.append(path)
+
+    with open(manifest_path(model), "w") as f:
+        json.dump(manifest, f)
+    return paths
+
+
+def write_agent_predictions(model, results, candidates_by_instance):
+    """
+    Escribe predictions/<model>.json; con candidatos (n_samples > 1) escribe
+    además una muestra por archivo y el manifiesto. Las instancias sin
+    candidatos (el coder falló) entran con su parche vacío.
+    """
+    if not candidates_by_instance:
+        with open("predictions/" + model + ".json", "w") as f:
+            json.dump(results, f)
+        return "predictions/" + model + ".json"
+    for result in results:
+        if result["instance_id"] not in candidates_by_instance:
+            candidates_by_instance[result["instance_id"]] = [
+                {"hash": None, "patch": result["model_patch"], "count": 1, "valid": False, "reason": result.get("error", "")}
+            ]
+    write_candidate_predictions(model, candidates_by_instance)
+    return "predictions/" + model + ".json"
+
+
+def sample_paths(model):
+    """Rutas de las muestras adicionales (k >= 1) registradas en el manifiesto."""
+    if not os.path.exists(manifest_path(model)):
+        return []
+    with open(manifest_path(model), "r") as f:
+        manifest = json.load(f)
+    samples = {c["sample"] for cs in manifest.values() for c in cs if c.get("sample") and c["sample"] != model}
+    return ["predictions/" + s + ".json" for s in sorted(samples)]
+
+
+def record_candidate_outcomes(model):
+    """
+    Añade al manifiesto si cada candidato evaluado resolvió la instancia y
+    devuelve un resumen con pass@1 y pass@k por instancia.
+    """
+    if not os.path.exists(manifest_path(model)):
+        return None
+    with open(manifest_path(model), "r") as f:
+        manifest = json.load(f)
+
+    resolved_cache = {}
+    pass_1 = 0
+    pass_k = 0
+    for instance_id, candidates in manifest.items():
+        for candidate in candidates:
+            sample = candidate.get("sample")
+            if sample is None:
+                candidate["resolved"] = None
+                continue
+            if sample not in resolved_cache:
+                resolved_cache[sample] = resolved_ids(sample)
+            candidate["resolved"] = instance_id in resolved_cache[sample]
+        outcomes = [c["resolved"] for c in candidates if c.get("sample")]
+        pass_1 += bool(outcomes and outcomes[0])
+        pass_k += any(outcomes)
+
+    with open(manifest_path(model), "w") as f:
+        json.dump(manifest, f)
+
+    total = max(len(manifest), 1)
+    return {
+        "instances": len(manifest),
+        "unique_candidates": sum(len(c) for c in manifest.values()),
+        "evaluated_candidates": sum(1 for cs in manifest.values() for c in cs if c.get("sample")),
+        "pass@1": pass_1 / total,
+        "pass@k": pass_k / total,
+    }
@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+# ---------------------------------------------------------------------
+# CLI DE ENTROPYEVOLVE
+# ---------------------------------------------------------------------
+# python cli.py run [--config cfg.json] [--max-iterations N] [--dry-run] [--profile [DIR]]
+# python cli.py resume [--profile [DIR]]
+# python cli.py eval-only predictions/A.json [...]
+# python cli.py report [A B ...] [--usage]
+# python cli.py bench {imports,retrieval,compaction}
+# python cli.py check {queue,batch}
+#
+# Solo se importan módulos ligeros aquí; langgraph, datasets y openai se
+# cargan dentro de las funciones que los usan.
+
+BENCH_MODULES = ["cli", "config", "cycle_graph", "tool", "langgraph.graph", "datasets", "openai"]
+
+
+def load_checked_config(path):
+    from config import load_config, validate_config
+
+    config = load_config(path)
+    errors = validate_config(config)
+    if errors:
+        for error in errors:
+            print(f"config error: {error}", file=sys.stderr)
+        sys.exit(2)
+    return config
+
+
+def cmd_run(args):
+    start = time.perf_counter()
+    config = load_checked_config(args.config)
+    if args.max_iterations is not None:
+        config["state"]["max_iterations"] = args.max_iterations
+
+    import cycle_graph
+
+    errors = cycle_graph.validate_graph()
+    for error in errors:
+        print(f"graph error: {error}", file=sys.stderr)
+    if errors:
+        return 2
+
+    if args.dry_run:
+        print(json.dumps(config, indent=2))
+        print(f"Config and graph OK ({len(cycle_graph.NODES)} nodes) in {time.perf_counter() - start:.3f}s")
+        return 0
+
+    from config import apply_config
+
+    initial_state = apply_config(config)
+    graph = cycle_graph.build_cycle_graph(args.profile)
+    graph.invoke(initial_state, {"recursion_limit": cycle_graph.recursion_limit(initial_state)})
+    return 0
+
+
+def cmd_resume(args):
+    config = load_checked_config(args.config)
+
+    import cycle_graph
+    from config import apply_config
+
+    apply_config(config)
+    if not os.path.exists(cycle_graph.PAUSED_STATE):
+        print("Nothing to resume: no paused state found.", file=sys.stderr)
+        return 1
+    state = cycle_graph.load_paused_state()
+    graph = cycle_graph.build_cycle_graph(args.profile)
+    graph.invoke(state, {"recursion_limit": cycle_graph.recursion_limit(state)})
+    return 0
+
+
+def cmd_eval_only(args):
+    config = load_checked_config(args.config)
+
+    from config import apply_config
+    from tool import run_swebench_eval, pool_results
+
+    apply_config(config)
+    models = []
+    for path in args.predictions:
+        print(f"Evaluating {path}...")
+        run_swebench_eval(path)
+        with open(path, "r") as f:
+            models.extend(sorted({p["model_name_or_path"] for p in json.load(f)}))
+    pool_results(models)
+    return 0
+
+
+def print_usage_report():
+    from usage import get_usage_ledger
+
+    ledger = get_usage_ledger()
+    print("Tokens by iteration and role:")
+    for row in ledger.usage_by_role():
+        print(f"  run {row['run_id'] or '-'} iter {row['iteration']} {row['role']:9s} calls={row['calls']} prompt={row['prompt_tokens']}"
+              f" completion={row['completion_tokens']} avg_latency={row['avg_latency_s']:.2f}s")
+    print("Resolved per 1k coder tokens, by prompt generation:")
+    for row in ledger.efficiency_by_generation():
+        print(f"  {row['prompt_hash']} slots={row['slots']} from_iter={row['first_iteration']}"
+              f" resolved={row['resolved']}/{row['submitted']} coder_tokens={row['coder_tokens']}"
+              f" evaluator_tokens={row['evaluator_tokens']} per_1k={row['resolved_per_1k_tokens']}")
+
+
+def cmd_report(args):
+    if args.usage:
+        print_usage_report()
+        return 0
+
+    from tool import pool_results
+
+    models = args.models
+    if not models:
+        with open("agents.json", "r") as f:
+            models = list(json.load(f).keys())
+    pool_results(models)
+    return 0
+
+
+def bench_imports():
+    """Tiempo de importación de cada módulo en un intérprete nuevo."""
+    rows = {}
+    for module in BENCH_MODULES:
+        code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        rows[module] = round(float(result.stdout), 3) if result.returncode == 0 else "not installed"
+        print(f"{module:20s} {rows[module]}")
+    return rows
+
+
+def cmd_bench(args):
+    if args.target == "imports":
+        bench_imports()
+    elif args.target == "retrieval":
+        from tool import select_problem
+        from retrieval import benchmark_index
+        benchmark_index(select_problem(args.n))
+    elif args.target == "compaction":
+        from compaction import compact_feedback
+        with open(args.feedback, "r") as f:
+            feedback = json.load(f)
+        start = time.perf_counter()
+        _, stats = compact_feedback(feedback)
+        print(stats, f"{time.perf_counter() - start:.3f}s")
+    return 0
+
+
+def cmd_check(args):
+    if args.target == "queue":
+        from worker import check_queue
+        ok = check_queue(n_workers=args.workers)
+    else:
+        from batch import check_local_batch
+        ok = check_local_batch()
+    return 0 if ok else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="entropyevolve", description="EntropyEvolve self-improvement loop")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="Run the improvement loop")
+    run.add_argument("--config", help="JSON config file (models, concurrency, state)")
+    run.add_argument("--max-iterations", type=int, default=None)
+    run.add_argument("--dry-run", action="store_true", help="Validate config and graph, then exit")
+    run.add_argument("--profile", nargs="?", const="profiles", default=None, metavar="DIR",
+                     help="Profile each node (cProfile + tracemalloc) into DIR")
+    run.set_defaults(func=cmd_run)
+
+    resume = sub.add_parser("resume", help="Resume a loop paused waiting for a batch")
+    resume.add_argument("--config")
+    resume.add_argument("--profile", nargs="?", const="profiles", default=None, metavar="DIR")
+    resume.set_defaults(func=cmd_resume)
+
+    eval_only = sub.add_parser("eval-only", help="Evaluate prediction files with SWE-bench")
+    eval_only.add_argument("predictions", nargs="+")
+    eval_only.add_argument("--config")
+    eval_only.set_defaults(func=cmd_eval_only)
+
+    report = sub.add_parser("report", help="Print SWE-bench results per agent")
+    report.add_argument("models", nargs="*")
+    report.add_argument("--usage", action="store_true", help="Token usage and resolved per 1k tokens from usage.db")
+    report.set_defaults(func=cmd_report)
+
+    bench = sub.add_parser("bench", help="Benchmarks")
+    bench.add_argument("target", choices=["imports", "retrieval", "compaction"])
+    bench.add_argument("--n", type=int, default=5, help="Instances for the retrieval benchmark")
+    bench.add_argument("--feedback", help="JSON {slot: [suggestions]} for the compaction benchmark")
+    bench.set_defaults(func=cmd_bench)
+
+    check = sub.add_parser("check", help="End-to-end checks of the work queue and the local batch backend")
+    check.add_argument("target", choices=["queue", "batch"])
+    check.add_argument("--workers", type=int, default=4, help="Worker processes for the queue check")
+    check.set_defaults(func=cmd_check)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import re
+from collections import defaultdict
+
+# ---------------------------------------------------------------------
+# COMPACTACIÓN DEL FEEDBACK ANTES DEL OPTIMIZADOR
+# ---------------------------------------------------------------------
+# Las sugerencias del evaluador se agrupan por similitud de Jaccard sobre
+# shingles de palabras, comparando todos los pares: el feedback de una
+# iteración son decenas de sugerencias, así que no hace falta LSH (que además
+# pierde pares cerca del umbral). De cada grupo queda un representante con
+# su frecuencia, y el total se recorta a un presupuesto de tokens.
+
+THRESHOLD = 0.4
+MAX_TOKENS = 3000
+MEDOID_SAMPLE = 50
+
+STOPWORDS = {
+    "a", "an", "the", "to", "of", "and", "or", "in", "on", "for", "with", "by", "be",
+    "is", "are", "that", "this", "it", "its", "as", "at", "from", "before", "after",
+    "should", "could", "can", "agent", "agents", "s",
+}
+
+def shingles(text):
+    """Unigramas y bigramas sin stopwords (con un stemming mínimo del plural)."""
+    words = [w.rstrip("s") if len(w) > 3 else w for w in re.findall(r"[a-z0-9]+", text.lower())]
+    words = [w for w in words if w not in STOPWORDS]
+    return set(words) | {words[i] + " " + words[i + 1] for i in range(len(words) - 1)}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def cluster(texts, threshold=THRESHOLD):
+    """Agrupa textos casi duplicados. Devuelve listas de índices."""
+    sets = [shingles(t) for t in texts]
+
+    parent = list(range(len(texts)))
+    for x in range(len(texts)):
+        for y in range(x + 1, len(texts)):
+            if _find(parent, x) == _find(parent, y):
+                continue
+            if jaccard(sets[x], sets[y]) >= threshold:
+                parent[_find(parent, x)] = _find(parent, y)
+
+    groups = defaultdict(list)
+    for i in range(len(texts)):
+        groups[_find(parent, i)].append(i)
+    return list(groups.values()), sets
+
+
+def _tokens(text):
+    return len(text) // 4 + 1
+
+
+def compact_feedback(feedback, threshold=THRESHOLD, max_tokens=MAX_TOKENS):
+    """
+    feedback: {slot: [sugerencia, ...]} como lo produce el evaluador.
+    Devuelve (compactado, stats). El compactado agrupa cada representante bajo
+    la clave de los slots que lo propusieron (p. ej. "A+C"), con el prefijo
+    "(xN)" cuando se repitió N veces.
+    """
+    items = [(model, str(text)) for model, texts in feedback.items() for text in texts]
+    texts = [text for _, text in items]
+    groups, sets = cluster(texts, threshold)
+
+    representatives = []
+    for members in groups:
+        # Medoide: el miembro más parecido en promedio al resto del grupo
+        # (en grupos grandes basta con comparar contra una muestra)
+        sample = members[:MEDOID_SAMPLE]
+        best = max(sample, key=lambda i: (sum(jaccard(sets[i], sets[j]) for j in sample), -len(texts[i])))
+        models = sorted({items[i][0] for i in members})
+        representatives.append((len(members), "+".join(models), texts[best]))
+
+    # Primero lo más repetido; a igualdad, lo más corto
+    representatives.sort(key=lambda r: (-r[0], len(r[2])))
+    compacted = {}
+    used = 0
+    kept = 0
+    for count, key, text in representatives:
+        entry = f"(x{count}) {text}" if count > 1 else text
+        cost = _tokens(entry)
+        if used + cost > max_tokens:
+            continue
+        compacted.setdefault(key, []).append(entry)
+        used += cost
+        kept += 1
+
+    tokens_in = sum(_tokens(t) for t in texts)
+    stats = {
+        "items_in": len(texts),
+        "clusters": len(groups),
+        "items_out": kept,
+        "tokens_in": tokens_in,
+        "tokens_out": used,
+        "compression_ratio": round(tokens_in / used, 2) if used else None,
+    }
+    return compacted, stats
@@ -0,0 +1,108 @@
+import json
+import copy
+import typing
+
+from state import SweBenchState
+
+# ---------------------------------------------------------------------
+# CONFIGURACIÓN DEL CICLO (archivo JSON)
+# ---------------------------------------------------------------------
+# {
+#   "models": {"coder": "gpt-4o-mini", "evaluator": "gpt-4o-mini", "optimizer": "gpt-4o-mini"},
+#   "concurrency": {"rpm": 500, "tpm": 200000, "eval_workers": 20},
+#   "state": {"max_iterations": 10, "n_instances": 5, "eval_budget": 12, ...}
+# }
+# "state" acepta cualquier campo de SweBenchState y se usa como estado inicial.
+
+DEFAULT_CONFIG = {
+    "models": {"coder": "gpt-4o-mini", "evaluator": "gpt-4o-mini", "optimizer": "gpt-4o-mini"},
+    "concurrency": {"eval_workers": 20},
+    "state": {},
+}
+
+# rpm/tpm son opcionales: si faltan, el limitador usa ENTROPY_RPM / ENTROPY_TPM
+CONCURRENCY_KEYS = {"rpm", "tpm", "eval_workers"}
+
+# Campos del estado que produce el propio grafo y no tiene sentido fijar en la configuración
+RUNTIME_KEYS = {
+    "problem", "coder_outputs", "eval_results", "meta_feedback", "optimized_prompts", "prompts",
+    "models", "logs_output", "candidate_outcomes", "paused_at", "agent_problems", "elites",
+    "compacted_feedback", "feedback_compaction", "usage_run_id",
+}
+
+SCALAR_TYPES = (int, float, str, bool, dict, list)
+
+
+def load_config(path=None):
+    """Configuración por defecto combinada con el archivo JSON, si se indica."""
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    if path:
+        with open(path, "r") as f:
+            user_config = json.load(f)
+        for section, values in user_config.items():
+            if isinstance(values, dict) and isinstance(config.get(section), dict):
+                config[section].update(values)
+            else:
+                config[section] = values
+    return config
+
+
+def _matches(value, annotation):
+    if value is None:
+        return True
+    if annotation in SCALAR_TYPES:
+        # int es válido donde se espera float, pero bool no es un int válido aquí
+        if annotation is float:
+            return isinstance(value, (int, float)) and not isinstance(value, bool)
+        if annotation is int:
+            return isinstance(value, int) and not isinstance(value, bool)
+        return isinstance(value, annotation)
+    return True
+
+
+def validate_config(config):
+    """Devuelve la lista de errores de la configuración (vacía si es válida)."""
+    errors = []
+    for section in config:
+        if section not in DEFAULT_CONFIG:
+            errors.append(f"Unknown section '{section}'")
+
+    for role, model in config.get("models", {}).items():
+        if role not in DEFAULT_CONFIG["models"]:
+            errors.append(f"Unknown role '{role}' in models")
+        elif not isinstance(model, str) or not model:
+            errors.append(f"models.{role} must be a model name")
+
+    for key, value in config.get("concurrency", {}).items():
+        if key not in CONCURRENCY_KEYS:
+            errors.append(f"Unknown concurrency setting '{key}'")
+        elif not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+            errors.append(f"concurrency.{key} must be a positive integer")
+
+    annotations = typing.get_type_hints(SweBenchState)
+    for key, value in config.get("state", {}).items():
+        if key not in annotations:
+            errors.append(f"Unknown state field '{key}'")
+        elif key in RUNTIME_KEYS:
+            errors.append(f"state.{key} is produced by the graph and cannot be configured")
+        elif not _matches(value, annotations[key]):
+            errors.append(f"state.{key} must be {annotations[key].__name__}")
+
+    backend = config.get("state", {}).get("batch_backend")
+    if backend is not None:
+        from batch import BACKENDS
+        if backend not in BACKENDS:
+            errors.append(f"state.batch_backend must be one of {sorted(BACKENDS)}")
+    return errors
+
+
+def apply_config(config):
+    """Aplica modelos y concurrencia a los módulos y devuelve el estado inicial."""
+    import tool
+    from ratelimit import configure_rate_limiter
+
+    tool.ROLE_MODELS.update(config["models"])
+    tool.EVAL_WORKERS = config["concurrency"]["eval_workers"]
+    if "rpm" in config["concurrency"] or "tpm" in config["concurrency"]:
+        configure_rate_limiter(config["concurrency"].get("rpm"), config["concurrency"].get("tpm"))
+    return dict(config["state"])
@@ -1,4 +1,3 @@
-from langgraph.graph import StateGraph, END
 from state import SweBenchState
 
 # Importamos los agentes (ya hechos con LangChain)
@@ -9,8 +8,23 @@ from tool import run_prompt_optimizer
 from tool import select_problem
 import json
 from tool import pool_results
+from candidates import sample_paths,record_candidate_outcomes
+from tool import load_problem,agent_batch_requests,join_agent_batch,evaluator_batch_requests,join_evaluator_batch
+from batch import pending_batch,submit_stage,collect_stage
+from ratelimit import get_rate_limiter
+from distributed import run_coders_on_queue,run_eval_on_queue
+from population import fill_population,allocate_budget,resolve_rates,select_elites,tournament,next_generation
+from compaction import compact_feedback
+from profiling import profile_dir_from_env,profile_nodes
+from usage import set_iteration,new_run_id,record_outcomes
+from eval_reports import load_report
+from failfast import run_fail_fast_eval
+from envpool import get_env_pool,CACHE_LEVEL
+from racing import race_generation
+from concurrent.futures import ThreadPoolExecutor
 import os 
 import shutil
+import sys
 
 # ---------------------------------------------------------------------
 # NODOS DEL
@@ -22,74 +36,196 @@ def get_prompts(state: SweBenchState):
     with open("agents.json","r") as f:
         prompts = json.load(f)
     
+    if state.get("population_size"):
+        prompts = fill_population(prompts, state["population_size"])
     state["prompts"] = prompts
-    state["models"] = ["A","B","C"]
+    state["models"] = list(prompts.keys())
+    # Un run_id por `cli.py run`: se guarda en el estado, así que al reanudar se conserva
+    state["usage_run_id"] = state.get("usage_run_id") or new_run_id()
+    set_iteration(state.get("iteration", 0), state["usage_run_id"])
     return state
 
 
 def node_select_problem(state: SweBenchState):
     """Selecciona un problema de SWE-bench."""
     print("Selecting problems")
-    problem = select_problem()
+    problem = select_problem(state.get("n_instances", 1))
     state["problem"] = problem
 
     print("Problems selected.")
     [print(instance["instance_id"]) for instance in problem]
+
+    # Las imágenes de evaluación se construyen mientras los coders generan
+    if state.get("env_pool_gb") and not state.get("work_queue"):
+        get_env_pool(state["env_pool_gb"]).prewarm([instance["instance_id"] for instance in problem])
+
+    # Reparto desigual del presupuesto de evaluación hacia los slots con mejor tasa
+    if state.get("eval_budget"):
+        rates = state.get("resolve_rates") or {}
+        rates = {model: rates.get(model) for model in state["models"]}
+        state["agent_problems"] = allocate_budget(rates, len(problem), state["eval_budget"])
+        print("Instances per agent:", state["agent_problems"])
+    else:
+        state["agent_problems"] = {}
     return state
 
 
+def agent_problem(state: SweBenchState, model):
+    """Instancias asignadas al slot: las n primeras del problema compartido (todas por defecto)."""
+    problem = state["problem"]
+    n = state.get("agent_problems", {}).get(model)
+    if n is None or n >= len(problem):
+        return problem
+    return problem.select(range(n)) if hasattr(problem, "select") else problem[:n]
+
+
 def node_run_coders(state: SweBenchState):
-    """Ejecuta los 3 codificadores con el mismo problema."""
+    """Ejecuta todos los codificadores de la población en paralelo."""
     print("Executing coding agents...")
     
-    problem = state["problem"]
+    models = state["models"]
     prompts = state["prompts"]
-
-    state["coder_outputs"] = {
-        "A": run_agent(problem, prompts["A"],"A"),
-        "B": run_agent(problem, prompts["B"],"B"),
-        "C": run_agent(problem, prompts["C"],"C")
-    }
+    context_budget = state.get("context_budget")
+    stream = state.get("stream", False)
+    n_samples = state.get("n_samples", 1)
+
+    if state.get("batch_backend"):
+        def build():
+            return [r for model in models for r in agent_batch_requests(agent_problem(state, model), prompts[model], model, context_budget)]
+        def join(contents):
+            state["coder_outputs"] = {model: join_agent_batch(agent_problem(state, model), model, contents) for model in models}
+        return run_stage_in_batch(state, "run_coders", build, join)
+
+    if state.get("work_queue"):
+        state["coder_outputs"] = run_coders_on_queue(
+            state["work_queue"], {model: agent_problem(state, model) for model in models}, prompts, context_budget, stream,
+            n_samples=n_samples, iteration=state.get("iteration", 0), usage_run_id=state.get("usage_run_id")
+        )
+        return state
+
+    # Las llamadas al LLM ya pasan por el limitador compartido, así que basta un hilo por slot
+    with ThreadPoolExecutor(max_workers=len(models)) as pool:
+        futures = {
+            model: pool.submit(run_agent, agent_problem(state, model), prompts[model], model, context_budget, stream, n_samples)
+            for model in models
+        }
+        state["coder_outputs"] = {model: future.result() for model, future in futures.items()}
     return state
 
 
+def collect_candidate_outcomes(outputs):
+    """pass@1 / pass@k de cada slot con muestras evaluadas (n_samples > 1)."""
+    candidate_outcomes = {}
+    for model in outputs:
+        summary = record_candidate_outcomes(model)
+        if summary is not None:
+            print(f"Agent {model} candidates: {summary}")
+            candidate_outcomes[model] = summary
+    return candidate_outcomes
+
+
 def node_swebench_eval(state: SweBenchState):
     """Evalúa los resultados de los coders con SWE-bench."""
     print("🧪 Evaluating patches on SWE-bench...")
     outputs = state["coder_outputs"]
 
-    models = ["A","B","C"]
+    if state.get("work_queue"):
+        state["logs_output"] = run_eval_on_queue(state["work_queue"], outputs, fail_fast=state.get("fail_fast", False))
+        state["candidate_outcomes"] = collect_candidate_outcomes(outputs)
+        record_outcomes(state.get("iteration", 0), state["prompts"], {model: load_report(model) for model in outputs})
+        return state
+
+    # El harness ya paraleliza por instancia (--max_workers); los agentes van en serie
+    # para que dos ejecuciones no construyan la misma imagen de Docker a la vez.
+    cache_level = None
+    if state.get("env_pool_gb"):
+        pool = get_env_pool(state["env_pool_gb"])
+        pool.acquire(state["problem"])
+        print("Env pool:", pool.summary())
+        cache_level = CACHE_LEVEL
+
+    # Con fail_fast los tests de regresión solo corren para parches que pasan los FAIL_TO_PASS
+    if state.get("fail_fast"):
+        evaluate = lambda path, model: run_fail_fast_eval(path, agent_problem(state, model), cache_level=cache_level)
+    else:
+        evaluate = lambda path, model: run_swebench_eval(path, cache_level=cache_level)
 
     logs_output = {}
     for model, result_path in outputs.items():
-        run_swebench_eval(result_path)
+        evaluate(result_path, model)
+        # Muestras adicionales (solo existen con n_samples > 1)
+        for sample_path in sample_paths(model):
+            evaluate(sample_path, model)
         #logs/run_evaluation/'run_id'/'model_id'/
         logs_output[model] = "logs/run_evaluation/improve_process/"+model+"/"
     state["logs_output"] = logs_output
+    state["candidate_outcomes"] = collect_candidate_outcomes(outputs)
+    record_outcomes(state.get("iteration", 0), state["prompts"], {model: load_report(model) for model in outputs})
     return state
 
 
 def node_meta_evaluator(state: SweBenchState):
     """El agente grande evalúa los resultados de SWE-bench."""
     print("🧠 Evaluator analizing agents result..")
+    models = state["models"]
+
+    if state.get("batch_backend"):
+        def build():
+            return [
+                r for model in models
+                for r in evaluator_batch_requests(agent_problem(state, model), state["coder_outputs"][model], state["logs_output"][model], model)
+            ]
+        def join(contents):
+            state["meta_feedback"] = {model: join_evaluator_batch(agent_problem(state, model), model, contents) for model in models}
+        return run_stage_in_batch(state, "meta_evaluator", build, join)
+
+    with ThreadPoolExecutor(max_workers=len(models)) as pool:
+        futures = {
+            model: pool.submit(
+                run_meta_evaluator,
+                problem=agent_problem(state, model),
+                outputs=state["coder_outputs"][model],
+                logs=state["logs_output"][model],
+                model=model
+            )
+            for model in models
+        }
+        state["meta_feedback"] = {model: future.result() for model, future in futures.items()}
 
-    feedback = {}
-    for model in state["models"]:
-        model_feedback = run_meta_evaluator(
-            problem=state["problem"],
-            outputs=state["coder_outputs"][model],
-            logs = state["logs_output"][model]
-        )
-        feedback[model] = model_feedback
-    state["meta_feedback"] = feedback
+    return state
 
+
+def node_compact_feedback(state: SweBenchState):
+    """Agrupa sugerencias casi duplicadas del evaluador antes del optimizador."""
+    print("🗜️  Compacting evaluator feedback...")
+    compacted, stats = compact_feedback(
+        state["meta_feedback"],
+        threshold=state.get("feedback_threshold", 0.4),
+        max_tokens=state.get("feedback_budget", 3000)
+    )
+    print("Feedback compaction:", stats)
+    state["compacted_feedback"] = compacted
+    state["feedback_compaction"] = stats
     return state
 
 
 def node_prompt_optimizer(state: SweBenchState):
-    """Genera nuevos prompts basados en el feedback del evaluador."""
+    """Genera nuevos prompts para los slots no élite a partir de padres elegidos por torneo."""
     print("🔧 Optimizing prompts...")
-    optimized = run_prompt_optimizer(state["meta_feedback"], state["prompts"])
+    models = state["models"]
+    rates = resolve_rates(models)
+    elites = select_elites(rates, state.get("n_elite", 1))
+    parents = list(dict.fromkeys(tournament(rates, state.get("n_parents", 2), k=state.get("tournament_size", 2))))
+    slots = [model for model in models if model not in elites]
+    print("Resolve rates:", rates, "elites:", elites, "parents:", parents)
+
+    optimized = {}
+    if slots:
+        optimized = run_prompt_optimizer(
+            state.get("compacted_feedback", state["meta_feedback"]), {model: state["prompts"][model] for model in parents}, slots
+        )
+    state["resolve_rates"] = rates
+    state["elites"] = elites
     state["optimized_prompts"] = optimized
     return state
 
@@ -97,19 +233,93 @@ def node_prompt_optimizer(state: SweBenchState):
 def node_update_coders(state: SweBenchState):
     """Actualiza los coders con los nuevos prompts."""
     print("🔄 Updating coding agents...")
-    state["prompts"] = state["optimized_prompts"]
+    if state.get("race_instances") and state["optimized_prompts"]:
+        # Los prompts actuales (élites incluidas) compiten con los nuevos antes de reemplazarlos
+        state["prompts"], state["resolve_rates"], _ = race_generation(
+            state["prompts"], state["optimized_prompts"], state["race_instances"],
+            eta=state.get("race_eta", 2),
+            min_instances=state.get("race_min_instances", 2),
+            confidence=state.get("race_confidence", 0.95),
+            context_budget=state.get("context_budget"),
+            fail_fast=state.get("fail_fast", False),
+            env_pool=get_env_pool(state["env_pool_gb"]) if state.get("env_pool_gb") else None
+        )
+    else:
+        state["prompts"], state["resolve_rates"] = next_generation(
+            state["prompts"], state["optimized_prompts"], state["resolve_rates"], state["elites"]
+        )
     with open("agents.json","w") as f:
        json.dump(state["prompts"],f)
     state["iteration"] = state.get("iteration", 0) + 1
     return state
 
 
+# ---------------------------------------------------------------------
+# MODO BATCH (pausa y reanudación)
+# ---------------------------------------------------------------------
+PAUSED_STATE = "batches/state.json"
+
+def save_paused_state(state: SweBenchState):
+    """Guarda el estado (con los ids en lugar del dataset) para reanudar después."""
+    snapshot = {k: v for k, v in state.items() if k != "problem"}
+    snapshot["problem_ids"] = [instance["instance_id"] for instance in state["problem"]]
+    os.makedirs(os.path.dirname(PAUSED_STATE), exist_ok=True)
+    with open(PAUSED_STATE,"w") as f:
+        json.dump(snapshot,f)
+
+
+def load_paused_state():
+    with open(PAUSED_STATE,"r") as f:
+        state = json.load(f)
+    state["problem"] = load_problem(state.pop("problem_ids"))
+    # Al reanudar no se pasa por get_prompts
+    set_iteration(state.get("iteration", 0), state.get("usage_run_id"))
+    return state
+
+
+def run_stage_in_batch(state: SweBenchState, stage, build_requests, join):
+    """Envía o consulta el batch de la etapa; si no ha terminado, pausa el grafo."""
+    if pending_batch(stage) is None:
+        submit_stage(stage, build_requests(), state["batch_backend"])
+
+    contents = collect_stage(stage)
+    if contents is None:
+        state["paused_at"] = stage
+        save_paused_state(state)
+        print(f"⏸️  Paused at {stage}, resume the cycle when the batch completes.")
+        return state
+
+    state["paused_at"] = None
+    join(contents)
+    return state
+
+
+def route_entry(state: SweBenchState):
+    """Al reanudar, vuelve directamente a la etapa que quedó en pausa."""
+    return state.get("paused_at") or "get_prompts"
+
+
+# Mismo valor que langgraph.graph.END; así el módulo no importa langgraph hasta compilar el grafo
+END = "__end__"
+
+
+def continue_unless_paused(next_node):
+    def route(state: SweBenchState):
+        return END if state.get("paused_at") else next_node
+    return route
+
+
 # ---------------------------------------------------------------------
 # 2️⃣ CONDICIÓN DEL LOOP
 # ---------------------------------------------------------------------
 def should_continue(state: SweBenchState):
     """Decide si continuar el ciclo o finalizar."""
-    pool_results()
+    pool_results(state["models"])
+    print("Rate limiter:", get_rate_limiter().snapshot())
+
+    if state.get("max_iterations") and state.get("iteration", 0) >= state["max_iterations"]:
+        print(f"🏁 Reached {state['max_iterations']} iterations, stopping.")
+        return END
     print(f"🔁 Continuando ciclo, iteración {state.get('iteration', 0) + 1}...")
 
     shutil.rmtree("logs/")
@@ -130,33 +340,103 @@ def should_continue(state: SweBenchState):
 # ---------------------------------------------------------------------
 # 3️⃣ CONSTRUCCIÓN DEL GRAFO
 # ---------------------------------------------------------------------
-def build_cycle_graph():
+NODES = {
+    "get_prompts": get_prompts,
+    "select_problem": node_select_problem,
+    "run_coders": node_run_coders,
+    "swebench_eval": node_swebench_eval,
+    "meta_evaluator": node_meta_evaluator,
+    "compact_feedback": node_compact_feedback,
+    "prompt_optimizer": node_prompt_optimizer,
+    "update_coders": node_update_coders,
+}
+
+EDGES = [
+    ("get_prompts", "select_problem"),
+    ("select_problem", "run_coders"),
+    ("swebench_eval", "meta_evaluator"),
+    ("compact_feedback", "prompt_optimizer"),
+    ("prompt_optimizer", "update_coders"),
+]
+
+# origen -> (función de ruta, destinos posibles)
+CONDITIONAL_EDGES = {
+    "run_coders": (continue_unless_paused("swebench_eval"), ["swebench_eval", END]),
+    "meta_evaluator": (continue_unless_paused("compact_feedback"), ["compact_feedback", END]),
+    # Bucle condicional
+    "update_coders": (should_continue, ["get_prompts", END]),
+}
+
+ENTRY = (route_entry, ["get_prompts", "run_coders", "meta_evaluator"])
+
+
+def validate_graph():
+    """
+    Revisa la definición del grafo sin importar langgraph: destinos que no
+    existen, nodos sin salida y nodos inalcanzables. Devuelve la lista de errores.
+    """
+    errors = []
+    targets = {name: [] for name in NODES}
+    for source, target in EDGES:
+        targets.setdefault(source, []).append(target)
+    for source, (_, destinations) in CONDITIONAL_EDGES.items():
+        targets.setdefault(source, []).extend(destinations)
+
+    for source, destinations in targets.items():
+        if source not in NODES:
+            errors.append(f"Edge from unknown node '{source}'")
+        if not destinations:
+            errors.append(f"Node '{source}' has no outgoing edge")
+        for target in destinations:
+            if target != END and target not in NODES:
+                errors.append(f"Edge {source} -> unknown node '{target}'")
+
+    reachable = set()
+    pending = [t for t in ENTRY[1] if t in NODES]
+    while pending:
+        node = pending.pop()
+        if node in reachable:
+            continue
+        reachable.add(node)
+        pending.extend(t for t in targets.get(node, []) if t in NODES)
+    for name in NODES:
+        if name not in reachable:
+            errors.append(f"Node '{name}' is unreachable from the entry point")
+    return errors
+
+
+def build_cycle_graph(profile_dir=None):
+    """profile_dir (o ENTROPY_PROFILE) activa el perfilado de cada nodo."""
+    from langgraph.graph import StateGraph
+
     workflow = StateGraph(SweBenchState)
-    
+
+    nodes = NODES
+    profile_dir = profile_dir or profile_dir_from_env()
+    if profile_dir:
+        nodes = profile_nodes(NODES, profile_dir)
+        print(f"Profiling graph nodes into {profile_dir}/")
+
     # Agregar nodos
-    workflow.add_node("get_prompts",get_prompts)
-    workflow.add_node("select_problem", node_select_problem)
-    workflow.add_node("run_coders", node_run_coders)
-    workflow.add_node("swebench_eval", node_swebench_eval)
-    workflow.add_node("meta_evaluator", node_meta_evaluator)
-    workflow.add_node("prompt_optimizer", node_prompt_optimizer)
-    workflow.add_node("update_coders", node_update_coders)
+    for name, node in nodes.items():
+        workflow.add_node(name, node)
 
     # Definir conexiones
-    workflow.set_entry_point("get_prompts")
-    workflow.add_edge("get_prompts","select_problem")
-    workflow.add_edge("select_problem", "run_coders")
-    workflow.add_edge("run_coders", "swebench_eval")
-    workflow.add_edge("swebench_eval", "meta_evaluator")
-    workflow.add_edge("meta_evaluator", "prompt_optimizer")
-    workflow.add_edge("prompt_optimizer", "update_coders")
-
-    # Bucle condicional
-    workflow.add_conditional_edges("update_coders", should_continue)
+    workflow.set_conditional_entry_point(ENTRY[0], ENTRY[1])
+    for source, target in EDGES:
+        workflow.add_edge(source, target)
+    for source, (route, destinations) in CONDITIONAL_EDGES.items():
+        workflow.add_conditional_edges(source, route, destinations)
 
     return workflow.compile()
 
+
+def recursion_limit(state):
+    """Pasos que LangGraph debe permitir (por defecto corta a los 25)."""
+    iterations = state.get("max_iterations") or 1000
+    return len(NODES) * (iterations + 1) + 10
+
+
 if __name__ == "__main__":
-    graph = build_cycle_graph()
-    initial_state = {}
-    graph.invoke(initial_state)
\ No newline at end of file
+    from cli import main
+    sys.exit(main(sys.argv[1:] or ["run"]))
@@ -0,0 +1,117 @@
+import os
+import json
+import uuid
+
+from workqueue import get_work_queue
+from candidates import write_agent_predictions, sample_paths
+from eval_reports import RUN_ID, log_path, merge_reports, write_report, report_path
+
+# ---------------------------------------------------------------------
+# COORDINADOR: reparte coders y evaluaciones entre workers
+# ---------------------------------------------------------------------
+# Encola un trabajo por (agente, instancia), espera a que el grupo termine y
+# deja los resultados donde los espera el resto del ciclo: predictions/,
+# '<model>.improve_process.json' y logs/run_evaluation/improve_process/.
+
+
+def run_coders_on_queue(queue_url, problems, prompts, context_budget=None, stream=False, poll_interval=5, n_samples=1,
+                        iteration=0, usage_run_id=None):
+    """
+    `problems` es {slot: instancias asignadas a ese slot}. iteration y
+    usage_run_id etiquetan en usage.db las llamadas hechas por los workers.
+    """
+    queue = get_work_queue(queue_url)
+    group_id = "coders-" + uuid.uuid4().hex[:8]
+    models = list(problems)
+    for model, problem in problems.items():
+        for instance in problem:
+            queue.enqueue(group_id, "run_agent", {
+                "model": model,
+                "prompt": prompts[model],
+                "instance_id": instance["instance_id"],
+                "context_budget": context_budget,
+                "stream": stream,
+                "n_samples": n_samples,
+                "iteration": iteration,
+                "usage_run_id": usage_run_id,
+            })
+    print(f"Queued {sum(len(p) for p in problems.values())} coder jobs ({group_id}).")
+
+    results = {model: [] for model in models}
+    candidates = {model: {} for model in models}
+    stream_stats = {model: [] for model in models}
+    for job in queue.wait_group(group_id, poll_interval=poll_interval):
+        payload = job["payload"]
+        prediction = job["result"] or {
+            "instance_id": payload["instance_id"],
+            "model_patch": "",
+            "model_name_or_path": payload["model"],
+            "error": job["error"],
+        }
+        if prediction.get("stream_stats"):
+            stream_stats[payload["model"]].append({"instance_id": payload["instance_id"], **prediction["stream_stats"]})
+        prediction.pop("stream_stats", None)
+        if prediction.get("candidates"):
+            candidates[payload["model"]][payload["instance_id"]] = prediction.pop("candidates")
+        prediction.pop("candidates", None)
+        results[payload["model"]].append(prediction)
+
+    # Mismos archivos que run_agent en el modo local
+    if stream:
+        for model in models:
+            with open("predictions/" + model + ".stream_stats.json", "w") as f:
+                json.dump(stream_stats[model], f)
+    return {model: write_agent_predictions(model, results[model], candidates[model]) for model in models}
+
+
+def run_eval_on_queue(queue_url, outputs, poll_interval=5, fail_fast=False):
+    """
+    Evalúa las predicciones de cada slot y sus muestras adicionales (n_samples
+    > 1). Cada archivo de predicciones deja su reporte con el nombre de modelo
+    de sus predicciones, como en el modo local.
+    """
+    queue = get_work_queue(queue_url)
+    group_id = "eval-" + uuid.uuid4().hex[:8]
+    predictions = []
+    for model, path in outputs.items():
+        for prediction_path in [path] + sample_paths(model):
+            with open(prediction_path, "r") as f:
+                predictions += json.load(f)
+    reports = {model: [] for model in outputs}
+    reports.update({prediction["model_name_or_path"]: [] for prediction in predictions})
+
+    # Como run_swebench_eval: un slot sin trabajos o con todos fallidos no debe
+    # quedarse con el reporte de la iteración anterior
+    for model in reports:
+        if os.path.exists(report_path(model)):
+            os.remove(report_path(model))
+
+    for prediction in predictions:
+        queue.enqueue(group_id, "swebench_eval", {
+            "model": prediction["model_name_or_path"],
+            "prediction": prediction,
+            # run_id propio para que dos trabajos del mismo host no compartan reporte
+            "run_id": f"{RUN_ID}.{group_id}.{prediction['instance_id']}",
+            "fail_fast": fail_fast,
+        })
+    print(f"Queued {len(predictions)} evaluation jobs ({group_id}).")
+
+    for job in queue.wait_group(group_id, poll_interval=poll_interval):
+        model = job["payload"]["model"]
+        result = job["result"]
+        if result is None:
+            print(f"Evaluation of {model}/{job['payload']['prediction']['instance_id']} failed: {job['error']}")
+            continue
+        reports[model].append(result["report"])
+        if result["log"] is not None:
+            path = log_path(model, result["instance_id"])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write(result["log"])
+
+    for model, partial in reports.items():
+        merged = merge_reports(partial)
+        if merged is not None:
+            write_report(model, merged)
+
+    return {model: f"logs/run_evaluation/{RUN_ID}/{model}/" for model in outputs}
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import subprocess
+
+# ---------------------------------------------------------------------
+# POOL DE ENTORNOS DE EVALUACIÓN (imágenes de Docker del harness)
+# ---------------------------------------------------------------------
+# El harness de SWE-bench construye una imagen de entorno por repo+versión
+# (sweb.env.*) y encima una imagen por instancia (sweb.eval.*). Con
+# --cache_level instance ambas se conservan entre ejecuciones, así que una
+# instancia que vuelve a salir empieza en un entorno ya construido. Cada
+# evaluación arranca un contenedor nuevo desde la imagen: el checkout limpio
+# entre usos viene de ahí.
+#
+# Este módulo lleva en env_pool.json qué imágenes hay por repo@versión y
+# cuándo se usaron, borra las menos usadas recientemente cuando el total
+# pasa del presupuesto de disco, y puede construir por adelantado las
+# imágenes de las instancias elegidas mientras los coders generan.
+
+POOL_FILE = "env_pool.json"
+DEFAULT_BUDGET_GB = 100
+CACHE_LEVEL = "instance"
+
+
+def pool_key(instance):
+    return f"{instance['repo']}@{instance['version']}"
+
+
+def image_keys(instance):
+    """(imagen de entorno, imagen de instancia) según el harness instalado."""
+    try:
+        from swebench.harness.test_spec.test_spec import make_test_spec
+    except ImportError:  # swebench < 3
+        from swebench.harness.test_spec import make_test_spec
+    spec = make_test_spec(dict(instance))
+    return spec.env_image_key, spec.instance_image_key
+
+
+def image_size(image):
+    """Tamaño en bytes de la imagen, o None si no existe."""
+    result = subprocess.run(
+        ["docker", "image", "inspect", "--format", "{{.Size}}", image],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None
+    return int(result.stdout.strip())
+
+
+def remove_image(image):
+    """True si la imagen ya no existe (borrada ahora o antes)."""
+    result = subprocess.run(["docker", "rmi", "-f", image], capture_output=True, text=True)
+    if result.returncode != 0 and image_size(image) is not None:
+        print(f"Env pool could not remove {image}: {result.stderr.strip()}")
+        return False
+    return True
+
+
+class EnvPool:
+
+    def __init__(self, budget_gb=DEFAULT_BUDGET_GB, path=POOL_FILE):
+        self.budget = budget_gb * 1024 ** 3
+        self.path = path
+        self.prewarm_process = None
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump(self.entries, f, indent=2)
+
+    def touch(self, instances):
+        """Marca como usados los entornos de `instances`. Devuelve sus claves."""
+        keys = set()
+        now = time.time()
+        for instance in instances:
+            key = pool_key(instance)
+            env_image, instance_image = image_keys(instance)
+            entry = self.entries.setdefault(key, {"env_image": env_image, "instance_images": [], "uses": 0, "size_bytes": 0})
+            if instance_image not in entry["instance_images"]:
+                entry["instance_images"].append(instance_image)
+            entry["last_used"] = now
+            entry["uses"] += 1
+            keys.add(key)
+        self.save()
+        return keys
+
+    def refresh_sizes(self):
+        """
+        Lee de Docker el tamaño de cada entrada y olvida las imágenes que ya
+        no existen. Las capas compartidas (imagen base) cuentan en cada
+        imagen, así que el total sobreestima el disco real.
+        """
+        for key in list(self.entries):
+            entry = self.entries[key]
+            images = [entry["env_image"]] + entry["instance_images"]
+            sizes = {image: image_size(image) for image in images}
+            entry["instance_images"] = [i for i in entry["instance_images"] if sizes[i] is not None]
+            if sizes[entry["env_image"]] is None and not entry["instance_images"]:
+                del self.entries[key]
+                continue
+            entry["size_bytes"] = sum(size for size in sizes.values() if size)
+        self.save()
+
+    def total_size(self):
+        return sum(entry["size_bytes"] for entry in self.entries.values())
+
+    def evict(self, protected=()):
+        """Borra entornos en orden LRU hasta quedar dentro del presupuesto."""
+        evicted = []
+        candidates = sorted(
+            (key for key in self.entries if key not in protected),
+            key=lambda key: self.entries[key].get("last_used", 0)
+        )
+        for key in candidates:
+            if self.total_size() <= self.budget:
+                break
+            entry = self.entries[key]
+            # Primero las imágenes de instancia: dependen de la de entorno
+            kept = [image for image in entry["instance_images"] + [entry["env_image"]] if not remove_image(image)]
+            if kept:
+                # Lo que no se pudo borrar sigue ocupando disco: la entrada se queda con ello
+                entry["instance_images"] = [image for image in entry["instance_images"] if image in kept]
+                entry["size_bytes"] = sum(image_size(image) or 0 for image in kept)
+                continue
+            del self.entries[key]
+            evicted.append(key)
+        if evicted:
+            print(f"Env pool evicted {evicted} ({self.total_size() / 1024 ** 3:.1f} GB in pool)")
+        self.save()
+        return evicted
+
+    def prewarm(self, instance_ids, dataset_name="princeton-nlp/SWE-bench_Lite", max_workers=4):
+        """Construye en segundo plano las imágenes de las instancias (no bloquea)."""
+        cmd = [
+            "python", "-m", "swebench.harness.prepare_images",
+            "--dataset_name", dataset_name,
+            "--instance_ids", *instance_ids,
+            "--max_workers", str(max_workers),
+        ]
+        self.prewarm_process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def wait_prewarm(self):
+        if self.prewarm_process is not None:
+            start = time.perf_counter()
+            self.prewarm_process.wait()
+            self.prewarm_process = None
+            print(f"Env pool prewarm finished (waited {time.perf_counter() - start:.1f}s)")
+
+    def acquire(self, instances):
+        """
+        Antes de evaluar: espera la preconstrucción, registra el uso y libera
+        espacio sin tocar los entornos de esta evaluación.
+        """
+        self.wait_prewarm()
+        keys = self.touch(instances)
+        self.refresh_sizes()
+        self.evict(protected=keys)
+        return keys
+
+    def summary(self):
+        return {
+            "environments": len(self.entries),
+            "instance_images": sum(len(e["instance_images"]) for e in self.entries.values()),
+            "size_gb": round(self.total_size() / 1024 ** 3, 2),
+            "budget_gb": round(self.budget / 1024 ** 3, 2),
+        }
+
+
+_POOL = None
+
+
+def get_env_pool(budget_gb=DEFAULT_BUDGET_GB):
+    """Pool del proceso (el prewarm lanzado en un nodo se espera en otro)."""
+    global _POOL
+    if _POOL is None:
+        _POOL = EnvPool(budget_gb)
+    _POOL.budget = budget_gb * 1024 ** 3
+    return _POOL
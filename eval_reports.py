@@ -0,0 +1,61 @@
+import os
+import json
+
+# SWE-bench escribe el reporte de cada modelo como '<model>.<run_id>.json'
+RUN_ID = "improve_process"
+
+
+def report_path(model, run_id=RUN_ID):
+    return f"{model}.{run_id}.json"
+
+
+def load_report(model, run_id=RUN_ID):
+    """Devuelve el reporte de SWE-bench del modelo o None si no existe."""
+    path = report_path(model, run_id)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def resolved_ids(model, run_id=RUN_ID):
+    report = load_report(model, run_id)
+    if report is None:
+        return set()
+    return set(report.get("resolved_ids", []))
+
+
+def log_path(model, instance_id, run_id=RUN_ID):
+    return f"logs/run_evaluation/{run_id}/{model}/{instance_id}/run_instance.log"
+
+
+def write_report(model, report, run_id=RUN_ID):
+    with open(report_path(model, run_id), "w") as f:
+        json.dump(report, f, indent=4)
+
+
+def merge_reports(reports):
+    """
+    Une reportes parciales (uno por instancia) en uno con el formato de
+    SWE-bench: suma los contadores y une las listas de ids.
+    """
+    reports = [r for r in reports if r]
+    if not reports:
+        return None
+    merged = {}
+    for key, value in reports[0].items():
+        if key == "incomplete_ids":
+            # Cada reporte parcial marca como incompletas todas las demás instancias
+            merged[key] = sorted(set.intersection(*(set(r.get(key, [])) for r in reports)))
+        elif key.endswith("_ids"):
+            merged[key] = sorted({i for r in reports for i in r.get(key, [])})
+        elif key.endswith("_instances") and key != "total_instances":
+            merged[key] = sum(r.get(key, 0) for r in reports)
+        elif key == "fail_fast":
+            # Resumen del modo fail-fast (failfast.py): se unen las listas de ids
+            merged[key] = dict(value)
+            for ids in ("promising_ids", "shortcut_ids"):
+                merged[key][ids] = sorted({i for r in reports for i in r.get(key, {}).get(ids, [])})
+        else:
+            merged[key] = value
+    return merged
@@ -0,0 +1,200 @@
+import os
+import re
+import json
+import shutil
+
+from tool import run_swebench_eval
+from eval_reports import RUN_ID, load_report, write_report, report_path
+
+# ---------------------------------------------------------------------
+# EVALUACIÓN FAIL-FAST (FAIL_TO_PASS primero)
+# ---------------------------------------------------------------------
+# Fase 1: el harness corre con un dataset local donde cada instancia tiene
+# PASS_TO_PASS vacío y el test_patch reducido a los módulos de test que
+# contienen los FAIL_TO_PASS. El harness elige qué tests correr a partir de
+# las rutas del test_patch, así que corre esos módulos enteros; lo que se
+# ahorra son los demás módulos. "Resuelto" en esta fase = pasan los F2P.
+# Fase 2: solo esas predicciones prometedoras pasan por la evaluación
+# completa. El resto queda como no resuelto sin correr las regresiones.
+#
+# Si el test_patch no se puede reducir (ids sin ruta, como en django y
+# sympy, o un único módulo de test) la fase 1 sería una ejecución completa:
+# esas instancias van directamente a la fase 2.
+#
+# El reporte final tiene el formato de SWE-bench más un campo "fail_fast" y
+# los logs de las instancias descartadas se copian a la ruta de RUN_ID, así
+# que el evaluador y pool_results no distinguen los dos modos.
+
+F2P_SUFFIX = "_f2p"
+F2P_RUN_ID = RUN_ID + F2P_SUFFIX
+DATASET_DIR = "predictions/fail_fast"
+
+TEST_FILE = re.compile(r"(^|/)(test_[^/]*|[^/]*_tests?|tests)\.py$")
+
+
+def _test_list(value):
+    # En SWE-bench Lite FAIL_TO_PASS / PASS_TO_PASS son strings con una lista JSON
+    return json.loads(value) if isinstance(value, str) else list(value or [])
+
+
+def split_diff(patch):
+    """Divide un diff en bloques por archivo: [(ruta, texto)]."""
+    chunks = re.split(r"(?m)^(?=diff --git )", patch)
+    result = []
+    for chunk in chunks:
+        match = re.match(r"diff --git a/(\S+) b/", chunk)
+        if match:
+            result.append((match.group(1), chunk))
+    return result
+
+
+def narrow_test_patch(test_patch, fail_to_pass):
+    """
+    Deja del test_patch los módulos de test que contienen algún F2P (ids del
+    tipo 'ruta.py::test') y todo lo que no es un módulo de test (fixtures,
+    datos). Si los ids no llevan ruta (django, sympy) no se puede saber qué
+    archivo los contiene y el test_patch se deja entero.
+    """
+    f2p_files = {test.split("::")[0] for test in fail_to_pass if "::" in test}
+    if not f2p_files:
+        return test_patch
+    chunks = split_diff(test_patch)
+    kept = [text for path, text in chunks if path in f2p_files or not TEST_FILE.search(path)]
+    if not any(path in f2p_files for path, _ in chunks):
+        return test_patch
+    return "".join(kept)
+
+
+def f2p_instance(instance):
+    instance = dict(instance)
+    fail_to_pass = _test_list(instance["FAIL_TO_PASS"])
+    empty = "[]" if isinstance(instance.get("PASS_TO_PASS"), str) else []
+    instance["PASS_TO_PASS"] = empty
+    instance["test_patch"] = narrow_test_patch(instance["test_patch"], fail_to_pass)
+    return instance
+
+
+def write_f2p_dataset(model, instances, run_id=RUN_ID):
+    # run_id en el nombre: los workers evalúan varias instancias del mismo slot a la vez
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    path = f"{DATASET_DIR}/{model}.{run_id}.dataset.json"
+    with open(path, "w") as f:
+        json.dump(instances, f)
+    return path
+
+
+def write_predictions(path, predictions):
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(predictions, f)
+    return path
+
+
+def _count_key(ids_key):
+    return ids_key[:-len("_ids")] + "_instances"
+
+
+def combine_reports(phase1, phase2, promising, shortcut, f2p_run_id=F2P_RUN_ID, direct=()):
+    """
+    Reporte final: el de la fase 1 con las instancias prometedoras
+    sustituidas por su resultado en la fase 2 (o como error si la fase 2 no
+    dejó reporte). `direct` son las que no pasaron por la fase 1. Los
+    contadores se recalculan a partir de las listas.
+    """
+    report = dict(phase1)
+    promising = set(promising)
+    for key, value in phase1.items():
+        if key.endswith("_ids") and key != "submitted_ids":
+            report[key] = [i for i in value if i not in promising]
+
+    report["submitted_ids"] = sorted(set(report.get("submitted_ids", [])) | promising)
+    if phase2 is None:
+        if promising:
+            report["error_ids"] = sorted(set(report.get("error_ids", [])) | promising)
+            report["completed_ids"] = [i for i in report.get("completed_ids", []) if i not in promising]
+    else:
+        for key, value in phase2.items():
+            if key.endswith("_ids") and key != "submitted_ids":
+                report[key] = sorted(set(report.get(key, [])) | (set(value) & promising))
+
+    for key in list(report):
+        if key.endswith("_ids") and _count_key(key) in report:
+            report[_count_key(key)] = len(report[key])
+
+    report["fail_fast"] = {
+        "f2p_run_id": f2p_run_id,
+        "promising_ids": sorted(promising),
+        "shortcut_ids": sorted(shortcut),
+        "full_only_ids": sorted(direct),
+        "full_run": phase2 is not None,
+    }
+    return report
+
+
+def copy_logs(model, instance_ids, from_run_id, to_run_id=RUN_ID):
+    for instance_id in instance_ids:
+        source = f"logs/run_evaluation/{from_run_id}/{model}/{instance_id}"
+        if os.path.isdir(source):
+            shutil.copytree(source, f"logs/run_evaluation/{to_run_id}/{model}/{instance_id}", dirs_exist_ok=True)
+
+
+def run_fail_fast_eval(path, instances, run_id=RUN_ID, cache_level=None):
+    """
+    Evalúa el archivo de predicciones `path` en dos fases y escribe el
+    reporte final en '<model>.<run_id>.json' (la fase 1 usa run_id + "_f2p").
+    Devuelve el resumen fail_fast o None si la fase 1 no produjo reporte.
+    """
+    with open(path, "r") as f:
+        predictions = json.load(f)
+    if not predictions:
+        return None
+    model = predictions[0]["model_name_or_path"]
+    f2p_run_id = run_id + F2P_SUFFIX
+
+    # Un reporte viejo de una iteración anterior no debe pasar por resultado de esta
+    for old in (f2p_run_id, run_id):
+        if os.path.exists(report_path(model, old)):
+            os.remove(report_path(model, old))
+
+    # Solo pasan por la fase 1 las instancias cuyo test_patch sí se reduce
+    submitted = {p["instance_id"] for p in predictions}
+    narrowed = [f2p_instance(instance) for instance in instances if instance["instance_id"] in submitted]
+    original = {instance["instance_id"]: instance["test_patch"] for instance in instances}
+    narrowed = [instance for instance in narrowed if instance["test_patch"] != original[instance["instance_id"]]]
+    fast_ids = {instance["instance_id"] for instance in narrowed}
+    direct = submitted - fast_ids
+
+    phase1 = None
+    promising = set(direct)
+    shortcut = []
+    if fast_ids:
+        fast_path = write_predictions(
+            f"{DATASET_DIR}/{model}.{run_id}.f2p.json", [p for p in predictions if p["instance_id"] in fast_ids]
+        )
+        run_swebench_eval(fast_path, run_id=f2p_run_id, dataset_name=write_f2p_dataset(model, narrowed, run_id), cache_level=cache_level)
+        phase1 = load_report(model, f2p_run_id)
+        if phase1 is None:
+            print(f"Fail-fast phase 1 produced no report for {model}")
+            return None
+        promising |= set(phase1.get("resolved_ids", [])) & fast_ids
+        shortcut = sorted(fast_ids - promising)
+        copy_logs(model, shortcut, f2p_run_id, run_id)
+
+    phase2 = None
+    if promising:
+        full_path = write_predictions(
+            f"{DATASET_DIR}/{model}.{run_id}.promising.json", [p for p in predictions if p["instance_id"] in promising]
+        )
+        run_swebench_eval(full_path, run_id=run_id, cache_level=cache_level)
+        phase2 = load_report(model, run_id)
+
+    if phase1 is None:
+        # Nada se pudo reducir: fue una evaluación normal
+        if phase2 is None:
+            return None
+        phase1 = {key: [] for key in phase2 if key.endswith("_ids")}
+        phase1.update({key: value for key, value in phase2.items() if not key.endswith("_ids")})
+    report = combine_reports(phase1, phase2, promising, shortcut, f2p_run_id, direct)
+    write_report(model, report, run_id)
+    print(f"Fail-fast {model}: {len(promising)} promising, {len(shortcut)} rejected on FAIL_TO_PASS")
+    return report["fail_fast"]
@@ -0,0 +1,112 @@
+import random
+import string
+
+from eval_reports import load_report
+
+# ---------------------------------------------------------------------
+# POBLACIÓN DE AGENTES
+# ---------------------------------------------------------------------
+# Los slots son las claves de agents.json ("A", "B", ...). Cada iteración se
+# mide la tasa de resolución de cada slot, los mejores (élite) conservan su
+# prompt y el resto se reemplaza con prompts nuevos del optimizador, que parte
+# de padres elegidos por torneo.
+
+PRIOR_RATE = 0.5
+
+
+def slot_names(n):
+    """A..Z y después A1..Z1, A2..Z2, ..."""
+    letters = string.ascii_uppercase
+    return [letters[i % 26] + (str(i // 26) if i >= 26 else "") for i in range(n)]
+
+
+def fill_population(prompts, size):
+    """Completa la población hasta `size` slots copiando prompts existentes en orden."""
+    prompts = dict(prompts)
+    existing = list(prompts.values())
+    for i, slot in enumerate(s for s in slot_names(size * 2) if s not in prompts):
+        if len(prompts) >= size:
+            break
+        prompts[slot] = existing[i % len(existing)]
+    return prompts
+
+
+def resolve_rates(models):
+    """
+    Tasa de resolución suavizada (Laplace) de cada slot según su último reporte.
+    Slots sin reporte quedan en None.
+    """
+    rates = {}
+    for model in models:
+        report = load_report(model)
+        if report is None or not report.get("submitted_instances"):
+            rates[model] = None
+            continue
+        rates[model] = (report["resolved_instances"] + 1) / (report["submitted_instances"] + 2)
+    return rates
+
+
+def _rate(rates, model):
+    rate = rates.get(model)
+    return PRIOR_RATE if rate is None else rate
+
+
+def select_elites(rates, n_elite):
+    """Los n_elite slots con mejor tasa (los slots sin datos no son élite)."""
+    measured = [m for m, r in rates.items() if r is not None]
+    return sorted(measured, key=lambda m: -rates[m])[:n_elite]
+
+
+def tournament(rates, n_parents, k=2, rng=random):
+    """Elige n_parents slots por torneos de tamaño k."""
+    models = list(rates)
+    parents = []
+    for _ in range(n_parents):
+        contenders = rng.sample(models, min(k, len(models)))
+        parents.append(max(contenders, key=lambda m: _rate(rates, m)))
+    return parents
+
+
+def allocate_budget(rates, n_instances, budget, min_per_agent=1):
+    """
+    Reparte `budget` evaluaciones (agente, instancia) de forma proporcional a
+    la tasa de cada slot, con al menos min_per_agent y como mucho n_instances.
+    Devuelve {slot: número de instancias}.
+    """
+    models = list(rates)
+    allocation = {m: min(min_per_agent, n_instances) for m in models}
+    remaining = budget - sum(allocation.values())
+    weights = {m: _rate(rates, m) for m in models}
+
+    while remaining > 0:
+        open_slots = [m for m in models if allocation[m] < n_instances]
+        if not open_slots:
+            break
+        total = sum(weights[m] for m in open_slots) or len(open_slots)
+        # Cuota proporcional del presupuesto restante; al menos 1 al slot con más peso
+        shares = {m: int(remaining * weights[m] / total) for m in open_slots}
+        if not any(shares.values()):
+            shares[max(open_slots, key=lambda m: (weights[m], -allocation[m]))] = 1
+        for m, share in shares.items():
+            share = min(share, n_instances - allocation[m], remaining)
+            allocation[m] += share
+            remaining -= share
+    return allocation
+
+
+def next_generation(prompts, optimized, rates, elites):
+    """
+    Nueva población: las élites conservan prompt (y tasa), el resto de slots
+    toma el prompt del optimizador (o mantiene el suyo si no vino ninguno).
+    Devuelve (prompts, rates) de la siguiente iteración.
+    """
+    new_prompts = {}
+    new_rates = {}
+    for model, prompt in prompts.items():
+        if model in elites or not optimized.get(model):
+            new_prompts[model] = prompt
+            new_rates[model] = rates.get(model)
+        else:
+            new_prompts[model] = optimized[model]
+            new_rates[model] = None
+    return new_prompts, new_rates
@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import cProfile
+import functools
+import tracemalloc
+
+# ---------------------------------------------------------------------
+# PERFILADO DE LOS NODOS DEL GRAFO (opcional)
+# ---------------------------------------------------------------------
+# Se activa con ENTROPY_PROFILE=<carpeta> (o "1" para "profiles/") o con
+# `python cli.py run --profile`. Por cada nodo e iteración escribe:
+#   profiles/iter_<n>/<nodo>.pstats       -> python -m pstats ...
+#   profiles/iter_<n>/<nodo>.alloc.txt    -> memoria asignada por el nodo (top líneas)
+#   profiles/rss_timeline.jsonl           -> RSS actual y pico tras cada nodo
+# cProfile solo mide el hilo que ejecuta el nodo; el trabajo en los
+# ThreadPoolExecutor de los nodos aparece como espera en ese hilo.
+
+DEFAULT_PROFILE_DIR = "profiles"
+TOP_ALLOCATIONS = 25
+
+
+def profile_dir_from_env():
+    """Carpeta de perfiles según ENTROPY_PROFILE, o None si está desactivado."""
+    value = os.environ.get("ENTROPY_PROFILE", "").strip()
+    if value.lower() in ("", "0", "false", "no"):
+        return None
+    if value.lower() in ("1", "true", "yes"):
+        return DEFAULT_PROFILE_DIR
+    return value
+
+
+def current_rss_kb():
+    """RSS actual en KB (Linux); None si /proc no está disponible."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_kb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if os.uname().sysname == "Darwin" else peak
+
+
+def write_allocations(path, before, after, top=TOP_ALLOCATIONS):
+    stats = after.compare_to(before, "lineno")
+    with open(path, "w") as f:
+        f.write(f"Top {top} allocation changes by line\n")
+        for stat in stats[:top]:
+            f.write(f"{stat}\n")
+
+
+def profile_node(name, node, profile_dir):
+    """Envuelve un nodo con cProfile y tracemalloc."""
+
+    @functools.wraps(node)
+    def wrapper(state):
+        iteration = state.get("iteration", 0)
+        folder = os.path.join(profile_dir, f"iter_{iteration}")
+        os.makedirs(folder, exist_ok=True)
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            return node(state)
+        finally:
+            profiler.disable()
+            seconds = time.perf_counter() - start
+            profiler.dump_stats(os.path.join(folder, f"{name}.pstats"))
+            after = tracemalloc.take_snapshot()
+            write_allocations(os.path.join(folder, f"{name}.alloc.txt"), before, after)
+            traced, traced_peak = tracemalloc.get_traced_memory()
+            with open(os.path.join(profile_dir, "rss_timeline.jsonl"), "a") as f:
+                f.write(json.dumps({
+                    "time": time.time(),
+                    "iteration": iteration,
+                    "node": name,
+                    "seconds": round(seconds, 3),
+                    "rss_kb": current_rss_kb(),
+                    "peak_rss_kb": peak_rss_kb(),
+                    "traced_kb": traced // 1024,
+                    "traced_peak_kb": traced_peak // 1024,
+                }) + "\n")
+
+    return wrapper
+
+
+def profile_nodes(nodes, profile_dir):
+    """{nombre: nodo} con cada nodo envuelto por profile_node."""
+    os.makedirs(profile_dir, exist_ok=True)
+    return {name: profile_node(name, node, profile_dir) for name, node in nodes.items()}
@@ -192,21 +192,38 @@ Keep Output Format **exactly as written** with the delimited areas, and  keep No
 # Task
 Using the above inputs and instructions, generate a **new improved agents specification**. Include the following sections in a **single valid JSON block**:
 
-Provide a JSON response with the following field:
-- "A": New agent code, with improvements. Directly obtained by "A" key.
-- "B": String, new agent code, different agent with improvements. Directly obtained by "B" key.
-- "C": String, another agent code, with improvements. DIrectly obtained by "C" key.
+Provide a JSON response with the following fields:
+$agent_fields
 
 Your response will be automatically parsed, so ensure that the string response is precisely in the correct format. Do NOT include the `<JSON>` tag in your output.
 """
 
 
 
-def create_task_agent_prompt(instance,prompt_template):
+CODE_CONTEXT_SECTION = """
+---
+## Repository Context
+
+The following snippets were retrieved from the repository at the commit where the issue must be fixed.
+Use their file paths and line numbers to produce a patch that applies cleanly.
+
+<code_context>
+$code_context
+</code_context>
+"""
+
+def create_task_agent_prompt(instance,prompt_template,code_context=None):
     values = {'test_patch':instance['test_patch'],'problem_statement':instance["problem_statement"]}
 
     template_prompt = Template(prompt_template)
-    prompt = template_prompt.substitute(values)
+    if code_context is None:
+        prompt = template_prompt.substitute(values)
+    elif "$code_context" in prompt_template:
+        # El prompt ya tiene un lugar reservado para el contexto
+        prompt = template_prompt.substitute(values,code_context=code_context)
+    else:
+        prompt = template_prompt.substitute(values)
+        prompt += Template(CODE_CONTEXT_SECTION).substitute(code_context=code_context)
     
     return prompt
 
@@ -242,6 +259,63 @@ def parse_task_response(md_text):
     
     return parsed
 
+class PatchStreamParser:
+    """Incremental parser for the '# Patch' / ```diff section of a streamed response.
+
+    Feed it text chunks as they arrive; `feed` returns True as soon as the
+    diff block is closed, so the caller can stop the stream.
+    """
+
+    # Solo cuenta con su salto de línea: en un buffer parcial $ casaría con '# Patch' de '# Patches'
+    PATCH_HEADER = re.compile(r'^#[ \t]+Patch[ \t]*\r?\n', re.MULTILINE)
+    DIFF_OPEN = "```diff\n"
+    FENCE_CLOSE = "\n```"
+
+    def __init__(self):
+        self.text = ""
+        self.header_end = None
+        self.diff_start = None
+        self.diff_end = None
+        self._scan = 0
+
+    def feed(self, chunk):
+        self.text += chunk
+        if self.diff_end is not None:
+            return True
+
+        if self.header_end is None:
+            match = self.PATCH_HEADER.search(self.text, self._scan)
+            if not match:
+                # El encabezado puede quedar partido entre dos chunks
+                self._scan = max(0, self.text.rfind("\n"))
+                return False
+            self.header_end = match.end()
+            self._scan = self.header_end
+
+        if self.diff_start is None:
+            pos = self.text.find(self.DIFF_OPEN, self._scan)
+            if pos == -1:
+                self._scan = max(self.header_end, len(self.text) - len(self.DIFF_OPEN))
+                return False
+            self.diff_start = pos + len(self.DIFF_OPEN)
+            self._scan = self.diff_start - 1
+
+        pos = self.text.find(self.FENCE_CLOSE, self._scan)
+        if pos == -1:
+            self._scan = max(self.diff_start - 1, len(self.text) - len(self.FENCE_CLOSE))
+            return False
+        self.diff_end = pos + len(self.FENCE_CLOSE)
+        return True
+
+    @property
+    def done(self):
+        return self.diff_end is not None
+
+    def result(self):
+        """Same structure as parse_task_response, using the text up to the closing fence."""
+        text = self.text[:self.diff_end] if self.done else self.text
+        return parse_task_response(text)
+
 def get_log(log_file):
     with open(log_file, "r") as f:
         lineas = f.readlines()
@@ -265,8 +339,13 @@ def parse_meta_agent_generator(response):
     response_json = json.loads(response)
     return response_json
 
-def create_generator_prompt(feedback,past_agents):
+def create_generator_prompt(feedback,past_agents,agent_keys=("A","B","C")):
     prompt_template = Template(META_IMPROMENT_GENERATOR)
 
-    prompt = prompt_template.substitute(error_analyzer_analysis=feedback,subsequent_agent_codes=past_agents)
+    # Un campo por slot a regenerar; todos deben ser agentes distintos entre sí
+    agent_fields = "\n".join(
+        f'- "{key}": String, new agent code with improvements, different from the other agents. Directly obtained by "{key}" key.'
+        for key in agent_keys
+    )
+    prompt = prompt_template.substitute(error_analyzer_analysis=feedback,subsequent_agent_codes=past_agents,agent_fields=agent_fields)
     return prompt
\ No newline at end of file
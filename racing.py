@@ -0,0 +1,203 @@
+import os
+import json
+import math
+from statistics import NormalDist
+from concurrent.futures import ThreadPoolExecutor
+
+from tool import run_agent, run_swebench_eval, select_problem
+from eval_reports import RUN_ID, resolved_ids, report_path
+from failfast import run_fail_fast_eval
+from envpool import CACHE_LEVEL
+
+# ---------------------------------------------------------------------
+# SELECCIÓN DE PROMPTS POR CARRERA (successive halving)
+# ---------------------------------------------------------------------
+# Los candidatos (prompt actual de cada slot y el propuesto por el
+# optimizador) se evalúan sobre subconjuntos crecientes de instancias nuevas:
+# min_instances, luego x eta, x eta^2, ... En cada ronda se descarta a
+# quien queda dominado con confianza (cota superior de Wilson por debajo de
+# la mejor cota inferior) y después se recorta a los mejores por tasa, con
+# un recorte geométrico que llega a `keep` supervivientes en la última
+# ronda. Así casi todo el presupuesto de harness y LLM va a los prompts
+# prometedores.
+
+SELECTION_FILE = "agents.selection.json"
+
+
+def wilson_interval(successes, n, confidence=0.95):
+    """Intervalo de Wilson para una proporción binomial."""
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = successes / n
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def round_sizes(max_instances, min_instances=2, eta=2):
+    """Tamaños acumulados de cada ronda: 2, 4, 8, ... hasta max_instances."""
+    sizes = []
+    size = min_instances
+    while size < max_instances:
+        sizes.append(size)
+        size *= eta
+    sizes.append(max_instances)
+    return sizes
+
+
+def successive_halving(candidates, instances, evaluate, keep=1, eta=2, min_instances=2, confidence=0.95):
+    """
+    candidates: {nombre: prompt}. evaluate(candidatos, instancias, ronda)
+    devuelve {nombre: ids resueltos} para esas instancias.
+    Devuelve (ganadores ordenados por tasa, evidencia).
+    """
+    alive = list(candidates)
+    counts = {name: {"resolved": 0, "evaluated": 0} for name in candidates}
+    rounds = []
+    done = 0
+
+    sizes = round_sizes(len(instances), min_instances, eta)
+    # Supervivientes tras cada ronda: de len(candidates) a keep en len(sizes) pasos
+    shrink = (len(candidates) / keep) ** (1 / len(sizes)) if keep else 1
+    targets = [max(keep, math.ceil(len(candidates) / shrink ** (i + 1) - 1e-9)) for i in range(len(sizes))]
+
+    for index, size in enumerate(sizes):
+        if len(alive) <= keep:
+            break
+        batch = instances[done:size]
+        done = size
+        resolved = evaluate({name: candidates[name] for name in alive}, batch, index)
+        for name in alive:
+            counts[name]["resolved"] += len(resolved.get(name, ()))
+            counts[name]["evaluated"] += len(batch)
+
+        bounds = {name: wilson_interval(counts[name]["resolved"], counts[name]["evaluated"], confidence) for name in alive}
+        rate = lambda name: counts[name]["resolved"] / max(counts[name]["evaluated"], 1)
+        status = {name: "alive" for name in alive}
+
+        # Carrera: fuera los dominados con confianza (nunca por debajo de keep)
+        best_lower = max(low for low, _ in bounds.values())
+        for name in sorted(alive, key=lambda n: bounds[n][1]):
+            if len(alive) <= keep:
+                break
+            if bounds[name][1] < best_lower:
+                alive.remove(name)
+                status[name] = "dominated"
+
+        # Recorte: solo los mejores por tasa siguen a la siguiente ronda
+        alive.sort(key=lambda n: (-rate(n), -bounds[n][0]))
+        for name in alive[targets[index]:]:
+            status[name] = "halved"
+        alive = alive[:targets[index]]
+
+        rounds.append({
+            "round": index,
+            "instances": [instance["instance_id"] for instance in batch],
+            "candidates": {
+                name: {**counts[name], "rate": round(rate(name), 3),
+                       "wilson": [round(b, 3) for b in bounds[name]], "status": status[name]}
+                for name in status
+            },
+        })
+
+    def score(name):
+        evaluated = counts[name]["evaluated"]
+        return (name in alive, counts[name]["resolved"] / evaluated if evaluated else 0.0, evaluated)
+
+    ranking = sorted(candidates, key=score, reverse=True)
+    evaluations = sum(c["evaluated"] for c in counts.values())
+    evidence = {
+        "rounds": rounds,
+        "final": {name: counts[name] for name in ranking},
+        "survivors": alive,
+        "evaluations": evaluations,
+        # Lo que habría costado evaluar todos los candidatos en todas las instancias
+        "full_evaluations": len(candidates) * len(instances),
+        "confidence": confidence,
+    }
+    return ranking, evidence
+
+
+def assign_slots(slots, ranking):
+    """
+    Reparte los mejores len(slots) candidatos entre los slots. Un prompt
+    actual que gana conserva su slot; los slots libres toman el resto en
+    orden de ranking.
+    """
+    winners = ranking[:len(slots)]
+    assignment = {slot: slot for slot in slots if slot in winners}
+    remaining = [name for name in winners if name not in assignment.values()]
+    for slot in slots:
+        if slot not in assignment:
+            assignment[slot] = remaining.pop(0)
+    return {slot: assignment[slot] for slot in slots}
+
+
+def make_evaluator(context_budget=None, fail_fast=False, env_pool=None):
+    """
+    evaluate() de successive_halving con los coders y el harness del ciclo.
+    Con env_pool las instancias de cada ronda se registran en el pool antes
+    del harness, para que sus imágenes entren en el presupuesto de disco.
+    """
+    cache_level = CACHE_LEVEL if env_pool is not None else None
+
+    def evaluate(candidates, instances, index):
+        run_id = f"{RUN_ID}_race{index}"
+        models = {name: "race-" + name.replace("+", "-new") for name in candidates}
+        with ThreadPoolExecutor(max_workers=len(candidates)) as pool:
+            paths = {
+                name: pool.submit(run_agent, instances, prompt, models[name], context_budget)
+                for name, prompt in candidates.items()
+            }
+            paths = {name: future.result() for name, future in paths.items()}
+
+        if env_pool is not None:
+            env_pool.acquire(instances)
+        ids = {instance["instance_id"] for instance in instances}
+        resolved = {}
+        for name, path in paths.items():
+            if fail_fast:
+                run_fail_fast_eval(path, instances, run_id=run_id, cache_level=cache_level)
+            else:
+                run_swebench_eval(path, run_id=run_id, cache_level=cache_level)
+            resolved[name] = resolved_ids(models[name], run_id) & ids
+            if os.path.exists(report_path(models[name], run_id)):
+                os.remove(report_path(models[name], run_id))
+        return resolved
+
+    return evaluate
+
+
+def race_generation(prompts, optimized, max_instances, eta=2, min_instances=2, confidence=0.95,
+                    context_budget=None, fail_fast=False, env_pool=None):
+    """
+    Corre la carrera entre los prompts actuales ("A") y los del optimizador
+    ("A+") sobre instancias nuevas y devuelve (prompts, tasas, evidencia)
+    para los mismos slots. La evidencia se guarda en agents.selection.json.
+    """
+    candidates = dict(prompts)
+    for slot, prompt in optimized.items():
+        if prompt and prompt != prompts.get(slot):
+            candidates[slot + "+"] = prompt
+
+    instances = list(select_problem(max_instances))
+    evaluate = make_evaluator(context_budget, fail_fast, env_pool)
+    ranking, evidence = successive_halving(
+        candidates, instances, evaluate, keep=len(prompts), eta=eta, min_instances=min_instances, confidence=confidence
+    )
+
+    assignment = assign_slots(list(prompts), ranking)
+    new_prompts = {slot: candidates[name] for slot, name in assignment.items()}
+    # Misma tasa suavizada (Laplace) que population.resolve_rates
+    new_rates = {
+        slot: (evidence["final"][name]["resolved"] + 1) / (evidence["final"][name]["evaluated"] + 2)
+        for slot, name in assignment.items()
+    }
+    evidence["assignment"] = assignment
+    evidence["prompts"] = candidates
+    with open(SELECTION_FILE, "w") as f:
+        json.dump(evidence, f, indent=2)
+    print(f"Race: {evidence['evaluations']}/{evidence['full_evaluations']} evaluations, assignment {assignment}")
+    return new_prompts, new_rates, evidence
@@ -0,0 +1,199 @@
+import os
+import time
+import heapq
+import random
+import itertools
+import threading
+
+# ---------------------------------------------------------------------
+# LIMITADOR DE PETICIONES COMPARTIDO (RPM / TPM)
+# ---------------------------------------------------------------------
+# Un único limitador por proceso para coders, evaluador y optimizador. Cuando
+# hay cola, pasa primero el rol con mayor prioridad (número más bajo): una
+# iteración perdida del optimizador cuesta más que un parche de un coder.
+
+ROLE_PRIORITY = {"optimizer": 0, "evaluator": 1, "coder": 2}
+
+DEFAULT_RPM = 500
+DEFAULT_TPM = 200000
+
+MAX_RETRIES = 6
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+RETRYABLE_ERRORS = ("APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError")
+
+
+class TokenBucket:
+    """Cubeta que se rellena a `per_minute` unidades por minuto."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Segundos hasta que haya `amount` unidades (0 si ya las hay)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= amount
+
+
+class RateLimiter:
+
+    def __init__(self, rpm=DEFAULT_RPM, tpm=DEFAULT_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.cond = threading.Condition()
+        self.queue = []
+        self.counter = itertools.count()
+        self.blocked_until = 0.0
+        self.stats = {}
+
+    def _role_stats(self, role):
+        return self.stats.setdefault(role, {
+            "requests": 0, "throttled_s": 0.0, "retries": 0, "rate_limited": 0, "failures": 0
+        })
+
+    def acquire(self, role, est_tokens):
+        """Bloquea hasta que el rol pueda hacer una petición de ~est_tokens tokens."""
+        ticket = (ROLE_PRIORITY.get(role, len(ROLE_PRIORITY)), next(self.counter))
+        start = time.monotonic()
+        with self.cond:
+            heapq.heappush(self.queue, ticket)
+            while True:
+                now = time.monotonic()
+                if self.queue[0] == ticket:
+                    wait = max(
+                        self.blocked_until - now,
+                        self.requests.wait_time(1, now),
+                        self.tokens.wait_time(est_tokens, now),
+                    )
+                    if wait <= 0:
+                        heapq.heappop(self.queue)
+                        self.requests.take(1)
+                        self.tokens.take(est_tokens)
+                        self.cond.notify_all()
+                        break
+                else:
+                    wait = None
+                self.cond.wait(timeout=wait)
+
+            stats = self._role_stats(role)
+            stats["requests"] += 1
+            stats["throttled_s"] += time.monotonic() - start
+
+    def settle(self, est_tokens, used_tokens):
+        """Ajusta la cubeta TPM con el uso real reportado por la API."""
+        with self.cond:
+            self.tokens.take(used_tokens - est_tokens)
+
+    def block(self, seconds):
+        """Pausa a todos los roles (por ejemplo tras un 429 con Retry-After)."""
+        with self.cond:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.cond.notify_all()
+
+    def call(self, fn, role, est_tokens, max_retries=MAX_RETRIES):
+        """
+        Ejecuta fn() respetando el límite y reintenta los errores transitorios
+        con backoff exponencial, usando Retry-After cuando la API lo envía.
+        """
+        for attempt in range(max_retries + 1):
+            self.acquire(role, est_tokens)
+            try:
+                result = fn()
+            except Exception as e:
+                if not is_retryable(e) or attempt == max_retries:
+                    with self.cond:
+                        self._role_stats(role)["failures"] += 1
+                    raise
+                delay = min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt) * (0.5 + random.random() / 2)
+                retry_after = get_retry_after(e)
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                with self.cond:
+                    stats = self._role_stats(role)
+                    stats["retries"] += 1
+                    if getattr(e, "status_code", None) == 429:
+                        stats["rate_limited"] += 1
+                print(f"{role} request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                if getattr(e, "status_code", None) == 429:
+                    # Un 429 frena a todos los roles, no solo al que lo recibió
+                    self.block(delay)
+                else:
+                    time.sleep(delay)
+                continue
+
+            usage = getattr(result, "usage", None)
+            if usage is not None and getattr(usage, "total_tokens", None):
+                self.settle(est_tokens, usage.total_tokens)
+            return result
+
+    def snapshot(self):
+        with self.cond:
+            return {role: dict(stats) for role, stats in self.stats.items()}
+
+
+def is_retryable(error):
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def get_retry_after(error):
+    """Segundos indicados por las cabeceras retry-after-ms / retry-after, si existen."""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+_LIMITER = None
+_LIMITER_LOCK = threading.Lock()
+
+
+def get_rate_limiter():
+    """Limitador del proceso, configurado con ENTROPY_RPM y ENTROPY_TPM."""
+    global _LIMITER
+    with _LIMITER_LOCK:
+        if _LIMITER is None:
+            _LIMITER = RateLimiter(
+                rpm=int(os.environ.get("ENTROPY_RPM", DEFAULT_RPM)),
+                tpm=int(os.environ.get("ENTROPY_TPM", DEFAULT_TPM)),
+            )
+        return _LIMITER
+
+
+def configure_rate_limiter(rpm=None, tpm=None):
+    """Reemplaza el limitador del proceso (los valores que falten salen del entorno)."""
+    global _LIMITER
+    with _LIMITER_LOCK:
+        _LIMITER = RateLimiter(
+            rpm=rpm or int(os.environ.get("ENTROPY_RPM", DEFAULT_RPM)),
+            tpm=tpm or int(os.environ.get("ENTROPY_TPM", DEFAULT_TPM)),
+        )
+        return _LIMITER
+
+
+def estimate_tokens(prompt, max_output=1500):
+    """Estimación previa (≈4 caracteres por token) para reservar la cubeta TPM."""
+    return len(prompt) // 4 + max_output
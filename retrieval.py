@@ -0,0 +1,319 @@
+import os
+import re
+import math
+import time
+import pickle
+import threading
+import subprocess
+from collections import Counter, OrderedDict, defaultdict
+
+# ---------------------------------------------------------------------
+# ÍNDICE LÉXICO (BM25) SOBRE LOS REPOSITORIOS DE SWE-BENCH
+# ---------------------------------------------------------------------
+# Cada repositorio se clona una sola vez (bare) en REPOS_DIR y su índice se
+# guarda en INDEX_DIR. El índice se guarda por blob de git, así que dos
+# base_commit del mismo repo solo tokenizan los archivos que cambiaron.
+
+REPOS_DIR = "repos"
+INDEX_DIR = "indexes"
+
+CHUNK_LINES = 40
+EXTENSIONS = (".py",)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+STOPWORDS = {
+    "the", "and", "for", "that", "this", "with", "from", "are", "not", "but",
+    "self", "return", "def", "import", "none", "true", "false", "if", "else",
+    "in", "is", "to", "of", "a", "an", "it", "be", "as", "or", "on", "at",
+}
+
+# Vistas (repo@commit) ya construidas en este proceso. Casi cada instancia
+# tiene su propio base_commit y una vista de django o sympy ocupa decenas de
+# MB, así que solo se guardan las MAX_VIEWS usadas más recientemente.
+MAX_VIEWS = 4
+_VIEWS = OrderedDict()
+_VIEWS_LOCK = threading.Lock()
+
+# Los coders de la población piden contexto del mismo repo a la vez: un lock
+# por repo evita dos `git clone` al mismo destino y dos escrituras del índice
+_REPO_LOCKS = {}
+_REPO_LOCKS_LOCK = threading.Lock()
+
+
+def _repo_lock(repo):
+    with _REPO_LOCKS_LOCK:
+        return _REPO_LOCKS.setdefault(repo, threading.RLock())
+
+
+def _slug(repo):
+    return repo.replace("/", "__")
+
+
+def _git(repo_path, *args, **kwargs):
+    return subprocess.run(
+        ["git", "-C", repo_path, *args],
+        capture_output=True, check=True, **kwargs
+    ).stdout
+
+
+def tokenize(text):
+    """Separa identificadores y sus partes (snake_case y camelCase)."""
+    tokens = []
+    for word in TOKEN_RE.findall(text):
+        lower = word.lower()
+        if len(lower) > 1 and lower not in STOPWORDS:
+            tokens.append(lower)
+        parts = re.findall(r"[A-Z]?[a-z0-9]+|[A-Z]+(?![a-z])", word)
+        if len(parts) > 1:
+            tokens.extend(p.lower() for p in parts if len(p) > 1 and p.lower() not in STOPWORDS)
+    return tokens
+
+
+def ensure_repo(repo, base_commit):
+    """Clona (bare) el repositorio si hace falta y asegura que base_commit existe."""
+    repo_path = os.path.join(REPOS_DIR, _slug(repo) + ".git")
+    with _repo_lock(repo):
+        if not os.path.isdir(repo_path):
+            os.makedirs(REPOS_DIR, exist_ok=True)
+            subprocess.run(
+                ["git", "clone", "--bare", "--quiet", f"https://github.com/{repo}.git", repo_path],
+                check=True
+            )
+        exists = subprocess.run(
+            ["git", "-C", repo_path, "cat-file", "-e", base_commit + "^{commit}"],
+            capture_output=True
+        )
+        if exists.returncode != 0:
+            _git(repo_path, "fetch", "--quiet", "origin")
+    return repo_path
+
+
+def list_files(repo_path, base_commit):
+    """Devuelve {path: blob_sha} de los archivos indexables en base_commit."""
+    out = _git(repo_path, "ls-tree", "-r", "--full-tree", base_commit).decode("utf-8", "replace")
+    files = {}
+    for line in out.splitlines():
+        meta, path = line.split("\t", 1)
+        _, kind, sha = meta.split()
+        if kind == "blob" and path.endswith(EXTENSIONS):
+            files[path] = sha
+    return files
+
+
+def read_blobs(repo_path, shas):
+    """Lee varios blobs con una sola llamada a `git cat-file --batch`."""
+    if not shas:
+        return {}
+    out = _git(repo_path, "cat-file", "--batch", input="\n".join(shas).encode() + b"\n")
+    blobs = {}
+    pos = 0
+    for sha in shas:
+        header_end = out.index(b"\n", pos)
+        size = int(out[pos:header_end].split()[2])
+        start = header_end + 1
+        blobs[sha] = out[start:start + size].decode("utf-8", "replace")
+        pos = start + size + 1
+    return blobs
+
+
+def chunk_text(text):
+    """Divide un archivo en ventanas de CHUNK_LINES líneas."""
+    lines = text.splitlines()
+    chunks = []
+    for start in range(0, max(len(lines), 1), CHUNK_LINES):
+        body = "\n".join(lines[start:start + CHUNK_LINES])
+        chunks.append((start + 1, min(start + CHUNK_LINES, len(lines)), body))
+    return chunks
+
+
+def _index_path(repo):
+    return os.path.join(INDEX_DIR, _slug(repo) + ".pkl")
+
+
+def load_index(repo):
+    path = _index_path(repo)
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    return {"blobs": {}, "commits": {}}
+
+
+def save_index(repo, index):
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    # Nombre temporal propio: otro proceso (worker) puede estar guardando el mismo índice
+    tmp = f"{_index_path(repo)}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(index, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, _index_path(repo))
+
+
+def build_index(repo, base_commit):
+    """
+    Actualiza el índice persistente de `repo` para `base_commit`.
+    Solo se tokenizan los blobs que no estaban indexados. Devuelve cuántos
+    blobs nuevos se procesaron.
+    """
+    with _repo_lock(repo):
+        return _build_index(repo, base_commit)
+
+
+def _build_index(repo, base_commit):
+    index = load_index(repo)
+    if base_commit in index["commits"]:
+        return 0
+
+    repo_path = ensure_repo(repo, base_commit)
+    files = list_files(repo_path, base_commit)
+    missing = sorted({sha for sha in files.values() if sha not in index["blobs"]})
+
+    for sha, text in read_blobs(repo_path, missing).items():
+        chunks = []
+        for start, end, body in chunk_text(text):
+            tf = Counter(tokenize(body))
+            chunks.append((start, end, dict(tf), sum(tf.values())))
+        index["blobs"][sha] = chunks
+
+    index["commits"][base_commit] = files
+    save_index(repo, index)
+    return len(missing)
+
+
+def _get_view(repo, base_commit):
+    """Construye (o reutiliza) el índice invertido de repo@base_commit."""
+    key = (repo, base_commit)
+    view = _cached_view(key)
+    if view is not None:
+        return view
+    with _repo_lock(repo):
+        # Otro hilo pudo construirla mientras se esperaba el lock
+        view = _cached_view(key)
+        if view is None:
+            view = _build_view(repo, base_commit)
+            with _VIEWS_LOCK:
+                _VIEWS[key] = view
+                while len(_VIEWS) > MAX_VIEWS:
+                    _VIEWS.popitem(last=False)
+    return view
+
+
+def _cached_view(key):
+    with _VIEWS_LOCK:
+        if key not in _VIEWS:
+            return None
+        _VIEWS.move_to_end(key)
+        return _VIEWS[key]
+
+
+def _build_view(repo, base_commit):
+    build_index(repo, base_commit)
+    index = load_index(repo)
+
+    chunks = []
+    postings = defaultdict(list)
+    total_len = 0
+    for path, sha in index["commits"][base_commit].items():
+        for start, end, tf, length in index["blobs"][sha]:
+            chunk_id = len(chunks)
+            chunks.append((path, sha, start, end, length))
+            total_len += length
+            for term, count in tf.items():
+                postings[term].append((chunk_id, count))
+
+    view = {
+        "chunks": chunks,
+        "postings": postings,
+        "avg_len": total_len / max(len(chunks), 1),
+    }
+    return view
+
+
+def search(repo, base_commit, query, top_k=10):
+    """Devuelve los top_k chunks como (score, path, sha, start, end)."""
+    view = _get_view(repo, base_commit)
+    chunks = view["chunks"]
+    n_chunks = len(chunks)
+    avg_len = view["avg_len"]
+
+    query_terms = set(tokenize(query))
+    scores = defaultdict(float)
+    for term in query_terms:
+        posting = view["postings"].get(term)
+        if not posting:
+            continue
+        idf = math.log(1 + (n_chunks - len(posting) + 0.5) / (len(posting) + 0.5))
+        for chunk_id, tf in posting:
+            length = chunks[chunk_id][4]
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len)
+            scores[chunk_id] += idf * tf * (BM25_K1 + 1) / norm
+
+    # Los archivos mencionados en el issue o en el test_patch pesan más
+    for chunk_id in scores:
+        path = chunks[chunk_id][0]
+        if path in query or os.path.basename(path)[:-3] in query_terms:
+            scores[chunk_id] *= 1.5
+
+    best = sorted(scores.items(), key=lambda x: -x[1])[:top_k]
+    return [(score, *chunks[chunk_id][:4]) for chunk_id, score in best]
+
+
+def get_code_context(instance, max_tokens=4000, top_k=10):
+    """
+    Devuelve fragmentos de código relevantes para la instancia, formateados
+    en Markdown y sin pasar de max_tokens (aprox. 4 caracteres por token).
+    """
+    repo = instance["repo"]
+    base_commit = instance["base_commit"]
+    query = instance["problem_statement"] + "\n" + instance.get("test_patch", "")
+
+    hits = search(repo, base_commit, query, top_k=top_k)
+    repo_path = ensure_repo(repo, base_commit)
+    blobs = read_blobs(repo_path, sorted({sha for _, _, sha, _, _ in hits}))
+
+    snippets = []
+    used = 0
+    for _, path, sha, start, end in hits:
+        body = "\n".join(blobs[sha].splitlines()[start - 1:end])
+        snippet = f"### {path} (lines {start}-{end})\n```python\n{body}\n```"
+        cost = len(snippet) // 4
+        if used + cost > max_tokens:
+            continue
+        snippets.append(snippet)
+        used += cost
+    return "\n\n".join(snippets)
+
+
+def benchmark_index(problem, max_tokens=4000):
+    """Mide tiempos de construcción y consulta del índice por instancia."""
+    rows = []
+    for instance in problem:
+        repo, commit = instance["repo"], instance["base_commit"]
+
+        start = time.perf_counter()
+        new_blobs = build_index(repo, commit)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _get_view(repo, commit)
+        view_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        get_code_context(instance, max_tokens=max_tokens)
+        query_time = time.perf_counter() - start
+
+        rows.append({
+            "instance_id": instance["instance_id"],
+            "new_blobs": new_blobs,
+            "build_s": round(build_time, 3),
+            "view_s": round(view_time, 3),
+            "query_s": round(query_time, 3),
+        })
+        print(rows[-1])
+    return rows
+
+
+if __name__ == "__main__":
+    from tool import select_problem
+    benchmark_index(select_problem())
@@ -24,6 +24,9 @@ class SweBenchState(TypedDict, total=False):
     # Contador de iteración actual
     iteration: int
 
+    # Id de la ejecución en usage.db (se conserva al reanudar)
+    usage_run_id: str
+
     # Límite máximo de iteraciones
     max_iterations: int
     
@@ -35,3 +38,64 @@ class SweBenchState(TypedDict, total=False):
     
     # Logs de salida
     logs_output: dict
+
+    # Presupuesto de tokens del contexto de código recuperado (None = desactivado)
+    context_budget: int
+
+    # Generación en streaming con corte al cerrar el bloque diff
+    stream: bool
+
+    # Muestras por instancia y agente (n= en una sola petición)
+    n_samples: int
+
+    # Resumen pass@1 / pass@k por agente cuando n_samples > 1
+    candidate_outcomes: dict
+
+    # Backend del modo batch ("local", "openai"); None = llamadas síncronas
+    batch_backend: str
+
+    # Etapa en pausa esperando a que termine su batch
+    paused_at: str
+
+    # URL de la cola de trabajos (p. ej. "sqlite:///queue.db"); None = todo en este proceso
+    work_queue: str
+
+    # Número de slots de la población (se completa copiando prompts de agents.json)
+    population_size: int
+
+    # Instancias de SWE-bench por iteración
+    n_instances: int
+
+    # Presupuesto total de evaluaciones (agente, instancia) por iteración; None = todas
+    eval_budget: int
+
+    # Instancias asignadas a cada slot: dict slot -> n
+    agent_problems: dict
+
+    # Tasa de resolución por slot (None si el prompt aún no se ha medido)
+    resolve_rates: dict
+
+    # Slots que conservan su prompt en la siguiente generación
+    n_elite: int
+    elites: list
+
+    # Feedback agrupado (clave = slots que lo propusieron) y estadísticas de compresión
+    compacted_feedback: dict
+    feedback_compaction: dict
+
+    # Umbral de Jaccard y presupuesto de tokens de la compactación
+    feedback_threshold: float
+    feedback_budget: int
+
+    # Evaluar primero los FAIL_TO_PASS y correr PASS_TO_PASS solo si pasan
+    fail_fast: bool
+
+    # Presupuesto de disco (GB) del pool de imágenes de evaluación; None = sin pool
+    env_pool_gb: int
+
+    # Selección por carrera: instancias máximas por candidato (None = sin carrera),
+    # factor de crecimiento de cada ronda, tamaño de la primera y confianza de Wilson
+    race_instances: int
+    race_eta: int
+    race_min_instances: int
+    race_confidence: float
@@ -1,55 +1,187 @@
-from datasets import load_dataset,disable_progress_bar
 import random
 from string import Template
 from prompts import create_task_agent_prompt
-from openai import OpenAI
 import os
 import json
 import subprocess
-from prompts import create_task_evaluator_agent_prompt,create_generator_prompt,parse_task_response
-disable_progress_bar()
+import time
+from prompts import create_task_evaluator_agent_prompt,create_generator_prompt,parse_task_response,PatchStreamParser
+from retrieval import get_code_context
+from candidates import dedup_candidates,write_agent_predictions
+from batch import build_request
+from ratelimit import get_rate_limiter,estimate_tokens
+from eval_reports import RUN_ID,load_report,report_path
+from usage import record_usage,usage_tags,prompt_hash
 
-def select_problem():
-    swebench = load_dataset('princeton-nlp/SWE-bench_Lite', split='test')
-    problems = swebench.select([random.randint(0,len(swebench)-1)for _ in range(1)])
+# Modelo por rol y workers del harness; cli.py los sobrescribe desde el archivo de configuración
+ROLE_MODELS = {"coder": "gpt-4o-mini", "evaluator": "gpt-4o-mini", "optimizer": "gpt-4o-mini"}
+EVAL_WORKERS = 20
+
+def load_swebench():
+    """Carga SWE-bench Lite; `datasets` se importa aquí porque tarda segundos."""
+    from datasets import load_dataset,disable_progress_bar
+    disable_progress_bar()
+    return load_dataset('princeton-nlp/SWE-bench_Lite', split='test')
+
+def select_problem(n=1):
+    swebench = load_swebench()
+    problems = swebench.select(random.sample(range(len(swebench)),n))
     return problems
 
-def run_agent(problem,prompt,model):
+def load_problem(instance_ids):
+    """
+    Recupera las instancias de SWE-bench Lite por id (para reanudar un ciclo
+    pausado), en el mismo orden que instance_ids: agent_problem toma las n
+    primeras y los custom_id del batch dependen de ese orden.
+    """
+    swebench = load_swebench()
+    index_of = {instance_id: i for i, instance_id in enumerate(swebench["instance_id"])}
+    return swebench.select([index_of[i] for i in instance_ids if i in index_of])
 
-    results = []
+_CLIENT = None
 
-    for instance in problem:
-        prompt = create_task_agent_prompt(instance,prompt)
+def get_client():
+    """Cliente compartido; los reintentos los hace el limitador de ratelimit.py."""
+    global _CLIENT
+    if _CLIENT is None:
+        from openai import OpenAI
+        _CLIENT = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"),max_retries=0)
+    return _CLIENT
+
+def chat_completion(role,prompt,model=None,max_output=1500,**params):
+    """chat.completions.create a través del limitador RPM/TPM compartido por todos los roles."""
+    model = model or ROLE_MODELS[role]
+    est_tokens = estimate_tokens(prompt,max_output*params.get("n",1))
+
+    def create():
+        start = time.perf_counter()
+        resp = get_client().chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}],
+            **params
+        )
+        # En streaming el uso llega al final del stream; lo registra stream_completion
+        if not params.get("stream"):
+            record_usage(role,model,resp.usage,time.perf_counter()-start)
+        return resp
+
+    return get_rate_limiter().call(create,role,est_tokens)
+
+def stream_completion(prompt,model=None):
+    """Consume la respuesta en streaming y la corta en cuanto se cierra el bloque diff."""
+    parser = PatchStreamParser()
+    stats = {"ttft_s": None, "time_to_patch_s": None, "early_stop": False}
+
+    start = time.perf_counter()
+    usage = None
+    stream = chat_completion("coder",prompt,model=model,stream=True,stream_options={"include_usage": True})
+    try:
+        for chunk in stream:
+            # El último chunk trae el uso real, pero solo si el stream no se cortó antes
+            if getattr(chunk,"usage",None) is not None:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            if stats["ttft_s"] is None:
+                stats["ttft_s"] = time.perf_counter() - start
+            if parser.feed(delta):
+                stats["time_to_patch_s"] = time.perf_counter() - start
+                stats["early_stop"] = True
+                break
+    finally:
+        # Cerrar la conexión deja de generar (y cobrar) tokens
+        stream.close()
+
+    stats["total_s"] = time.perf_counter() - start
+    stats["output_chars"] = len(parser.text)
+    record_usage("coder",model or ROLE_MODELS["coder"],usage,stats["total_s"],prompt=prompt,completion=parser.text)
+    return parser.result(),stats
+
+def generate_patch(instance,prompt,context_budget=None,stream=False,n_samples=1):
+    """
+    Genera el parche de un coder para una instancia. Devuelve un dict con
+    model_patch y, según el modo, stream_stats o candidates.
+    """
+    code_context = None
+    if context_budget:
+        try:
+            code_context = get_code_context(instance,max_tokens=context_budget)
+        except Exception as e:
+            print(f"Context retrieval failed for {instance['instance_id']}: {e}")
+    task_prompt = create_task_agent_prompt(instance,prompt,code_context)
+
+    if n_samples > 1:
+        # Una sola petición con n muestras (el streaming no aplica aquí)
+        resp = chat_completion("coder",task_prompt,n=n_samples)
+        patches = [parse_task_response(c.message.content or "").get("Patch",{}).get("diff_code","") for c in resp.choices]
+        # El clon del repo solo existe si retrieval está activo, así que solo entonces se hace git apply --check
+        candidates = dedup_candidates(patches,instance,apply_check=bool(context_budget))
+        code = next((c["patch"] for c in candidates if c["valid"]),candidates[0]["patch"])
+        return {"model_patch": code, "candidates": candidates}
+    if stream:
+        parsed,stats = stream_completion(task_prompt)
+        return {"model_patch": parsed.get("Patch",{}).get("diff_code",""), "stream_stats": stats}
+
+    resp = chat_completion("coder",task_prompt)
+    code = resp.choices[0].message.content
+    return {"model_patch": parse_task_response(code)["Patch"]["diff_code"]}
 
-        client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+def run_agent(problem,prompt,model,context_budget=None,stream=False,n_samples=1):
 
+    results = []
+    stream_stats = []
+    candidates_by_instance = {}
+
+    for instance in problem:
         try:
-            resp =  client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}]
-            )
-            code = resp.choices[0].message.content
-            code = parse_task_response(code)["Patch"]["diff_code"]
-            results.append({"instance_id": instance["instance_id"], "model_patch": code,"model_name_or_path":model})
+            with usage_tags(slot=model,prompt_hash=prompt_hash(prompt)):
+                generated = generate_patch(instance,prompt,context_budget,stream,n_samples)
+            if generated.get("candidates"):
+                candidates_by_instance[instance["instance_id"]] = generated["candidates"]
+            if generated.get("stream_stats"):
+                stream_stats.append({"instance_id": instance["instance_id"], **generated["stream_stats"]})
+            results.append({"instance_id": instance["instance_id"], "model_patch": generated["model_patch"],"model_name_or_path":model})
         except Exception as e:
-            return results.append({"instance_id": instance["instance_id"], "error": str(e)})
+            print(f"Agent {model} failed on {instance['instance_id']}: {e}")
+            results.append({"instance_id": instance["instance_id"], "model_patch": "","model_name_or_path":model,"error": str(e)})
     
-    with open("predictions/"+model+".json", "w") as f:
-            json.dump(results, f)
+    write_agent_predictions(model,results,candidates_by_instance)
+    if stream:
+        # Métricas de latencia separadas para no alterar el formato de SWE-bench
+        with open("predictions/"+model+".stream_stats.json", "w") as f:
+            json.dump(stream_stats, f)
     return "predictions/"+model+".json"
 
-def run_swebench_eval(path):
+def run_swebench_eval(path,run_id=RUN_ID,dataset_name="princeton-nlp/SWE-bench_Lite",cache_level=None):
+      """
+      dataset_name también acepta un archivo .json local con instancias.
+      cache_level ("env", "instance", ...) decide qué imágenes de Docker conserva el harness.
+      """
+      # Un reporte de una iteración anterior con el mismo run_id no debe pasar por el de esta
+      with open(path, "r") as f:
+            models = {prediction["model_name_or_path"] for prediction in json.load(f)}
+      for model in models:
+            if os.path.exists(report_path(model, run_id)):
+                  os.remove(report_path(model, run_id))
       cmd = [
             "python", "-m", "swebench.harness.run_evaluation",
-            "--dataset_name", "princeton-nlp/SWE-bench_Lite",
+            "--dataset_name", dataset_name,
             "--predictions_path", path,
-            "--max_workers", "20",
-            "--run_id", "improve_process",
+            "--max_workers", str(EVAL_WORKERS),
+            "--run_id", run_id,
             "--report_dir", "reports"
             ]
+      if cache_level:
+            cmd += ["--cache_level", cache_level]
       result = subprocess.run(cmd, capture_output=True, text=True)
+      if result.returncode != 0:
+            print(f"SWE-bench harness failed for {path} (exit {result.returncode}): {result.stderr[-2000:]}")
+      return result.returncode
 
-def run_meta_evaluator(problem,outputs,logs):
+def run_meta_evaluator(problem,outputs,logs,model=None):
     #$problem_statement
 
     with open(outputs) as f:
@@ -59,27 +191,84 @@ def run_meta_evaluator(problem,outputs,logs):
     for instance in problem:
         prompt = create_task_evaluator_agent_prompt(instance,predictions,logs+instance["instance_id"]+"/run_instance.log")
 
-        client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        try:
+            # El slot permite atribuir el coste del evaluador a la generación evaluada
+            with usage_tags(slot=model):
+                resp = chat_completion("evaluator",prompt)
+        except Exception as e:
+            # Solo llega aquí tras agotar los reintentos del limitador
+            print(f"Evaluator request failed for {instance['instance_id']}: {e}")
+            continue
 
         try:
-            resp =  client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}]
-            )
             result = resp.choices[0].message.content
             
             result_json = json.loads(result)
             
             feedback.extend(result_json["potential_improvements"])
         except Exception as e:
-            print(e)
-            result = '{"potential_improvements":[]}'
-            result_json = json.loads(result)
-            feedback.extend(result_json["potential_improvements"])
+            print(f"Evaluator response for {instance['instance_id']} is not valid JSON: {e}")
     return feedback
 
-def run_prompt_optimizer(feedback,prompts):
-     
+def agent_batch_requests(problem,prompt,model,context_budget=None):
+    """Peticiones del Batch API de un coder, una por instancia (custom_id = 'model::instance_id')."""
+    requests = []
+    for instance in problem:
+        code_context = None
+        if context_budget:
+            try:
+                code_context = get_code_context(instance,max_tokens=context_budget)
+            except Exception as e:
+                print(f"Context retrieval failed for {instance['instance_id']}: {e}")
+        task_prompt = create_task_agent_prompt(instance,prompt,code_context)
+        requests.append(build_request(model+"::"+instance["instance_id"],task_prompt,ROLE_MODELS["coder"]))
+    return requests
+
+def join_agent_batch(problem,model,contents):
+    """Escribe predictions/<model>.json con las respuestas del batch."""
+    results = []
+    for instance in problem:
+        content = contents.get(model+"::"+instance["instance_id"])
+        if content is None:
+            results.append({"instance_id": instance["instance_id"], "model_patch": "","model_name_or_path":model,"error": "batch request failed"})
+            continue
+        code = parse_task_response(content).get("Patch",{}).get("diff_code","")
+        results.append({"instance_id": instance["instance_id"], "model_patch": code,"model_name_or_path":model})
+
+    with open("predictions/"+model+".json", "w") as f:
+            json.dump(results, f)
+    return "predictions/"+model+".json"
+
+def evaluator_batch_requests(problem,outputs,logs,model):
+    """Peticiones del Batch API del evaluador para un coder."""
+    with open(outputs) as f:
+        predictions = json.load(f)
+
+    requests = []
+    for instance in problem:
+        prompt = create_task_evaluator_agent_prompt(instance,predictions,logs+instance["instance_id"]+"/run_instance.log")
+        requests.append(build_request(model+"::"+instance["instance_id"],prompt,ROLE_MODELS["evaluator"]))
+    return requests
+
+def join_evaluator_batch(problem,model,contents):
+    """Lista de potential_improvements del coder a partir de las respuestas del batch."""
+    feedback = []
+    for instance in problem:
+        content = contents.get(model+"::"+instance["instance_id"])
+        try:
+            feedback.extend(json.loads(content)["potential_improvements"])
+        except Exception as e:
+            print(f"Evaluator batch result for {model}::{instance['instance_id']} unusable: {e}")
+    return feedback
+
+def run_prompt_optimizer(feedback,prompts,slots=None):
+    """
+    Genera prompts nuevos para `slots` (por defecto todos) a partir del feedback
+    y de los prompts padres en `prompts`. Los slots que no vengan en la
+    respuesta quedan fuera del resultado.
+    """
+    slots = list(slots) if slots is not None else list(prompts.keys())
+
     completed_feed_back = []
     for model in feedback.keys():
         joined_analyses = "\n".join(f"- {a}" for a in feedback[model])
@@ -92,58 +281,31 @@ def run_prompt_optimizer(feedback,prompts):
     print("Feedback\n",)
     print(final_feedback)
 
-    prompt = create_generator_prompt(final_feedback,past_agents)
-
-    client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+    prompt = create_generator_prompt(final_feedback,past_agents,slots)
 
     try:
-        resp =  client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}]
-        )
+        resp = chat_completion("optimizer",prompt,max_output=4000)
         result = resp.choices[0].message.content
             
         result_json = json.loads(result)
     except Exception as e:
-        result_json = prompts
+        print(f"Prompt optimizer failed, keeping current prompts: {e}")
+        return {}
     
-    return result_json
-
+    return {slot: result_json[slot] for slot in slots if isinstance(result_json.get(slot),str)}
 
-def pool_results():
-    a_agent = "A.improve_process.json"
-    b_agent = "B.improve_process.json"
-    c_agent = "B.improve_process.json"
 
-    with open("A.improve_process.json","r") as f:
-        eval_json = json.load(f)
-        submitted = eval_json["submitted_instances"]
-        completed = eval_json["completed_instances"]
-        resolved = eval_json["resolved_instances"]
-        
-        print("Agent A results: \n")
-        print("Submitted: ",submitted)
-        print("Completed: ",completed)
-        print("Resolved: ", resolved)
-    
-    with open("B.improve_process.json","r") as f:
-        eval_json = json.load(f)
-        submitted = eval_json["submitted_instances"]
-        completed = eval_json["completed_instances"]
-        resolved = eval_json["resolved_instances"]
-        
-        print("Agent B results: \n")
-        print("Submitted: ",submitted)
-        print("Completed: ",completed)
-        print("Resolved: ", resolved)
-    
-    with open("B.improve_process.json","r") as f:
-        eval_json = json.load(f)
+def pool_results(models):
+    for model in models:
+        eval_json = load_report(model)
+        if eval_json is None:
+            print(f"Agent {model} has no report.")
+            continue
         submitted = eval_json["submitted_instances"]
         completed = eval_json["completed_instances"]
         resolved = eval_json["resolved_instances"]
         
-        print("Agent C results: \n")
+        print(f"Agent {model} results: \n")
         print("Submitted: ",submitted)
         print("Completed: ",completed)
         print("Resolved: ", resolved)
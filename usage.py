@@ -0,0 +1,236 @@
+import os
+import time
+import uuid
+import hashlib
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# ---------------------------------------------------------------------
+# REGISTRO DE USO DE TOKENS (SQLite)
+# ---------------------------------------------------------------------
+# Cada llamada de chat_completion guarda tokens de prompt y de respuesta,
+# latencia y modelo, etiquetados con iteración, rol, slot y el hash del
+# prompt del coder (su "generación"). Tras evaluar se guardan los resueltos
+# de cada slot, y efficiency_by_generation() da resueltos por 1k tokens.
+#
+# La ejecución (run_id) y la iteración son globales al proceso (las fija el
+# grafo, también al reanudar); slot y prompt_hash van en un contextvar porque
+# cada slot corre en su propio hilo. Los workers de la cola reciben run_id e
+# iteración en el trabajo y los pasan también como etiquetas. Cada
+# `cli.py run` vuelve a la iteración 0, así que calls y outcomes se
+# distinguen por run_id.
+
+DEFAULT_USAGE_DB = "usage.db"
+
+_RUN_ID = ""
+_ITERATION = 0
+_TAGS = contextvars.ContextVar("usage_tags", default={})
+
+
+def prompt_hash(prompt):
+    return hashlib.sha256(prompt.encode()).hexdigest()[:12]
+
+
+def new_run_id():
+    return uuid.uuid4().hex[:12]
+
+
+def set_iteration(iteration, run_id=None):
+    global _ITERATION, _RUN_ID
+    _ITERATION = iteration
+    if run_id is not None:
+        _RUN_ID = run_id
+
+
+@contextmanager
+def usage_tags(**tags):
+    """Etiqueta (slot, prompt_hash, run_id, iteration) las llamadas hechas dentro del bloque en este hilo."""
+    token = _TAGS.set({**_TAGS.get(), **tags})
+    try:
+        yield
+    finally:
+        _TAGS.reset(token)
+
+
+class UsageLedger:
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS calls (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                time REAL NOT NULL,
+                run_id TEXT NOT NULL DEFAULT '',
+                iteration INTEGER,
+                role TEXT NOT NULL,
+                slot TEXT,
+                prompt_hash TEXT,
+                model TEXT NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                completion_tokens INTEGER NOT NULL,
+                latency_s REAL NOT NULL,
+                estimated INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS outcomes (
+                run_id TEXT NOT NULL DEFAULT '',
+                iteration INTEGER NOT NULL,
+                slot TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                submitted INTEGER NOT NULL,
+                resolved INTEGER NOT NULL,
+                PRIMARY KEY (run_id, iteration, slot)
+            )
+        """)
+        self._migrate(conn)
+        conn.execute("DROP INDEX IF EXISTS calls_slot")
+        conn.execute("CREATE INDEX IF NOT EXISTS calls_run_slot ON calls (run_id, iteration, slot)")
+
+    def _migrate(self, conn):
+        """usage.db de antes de run_id: las filas viejas quedan con run_id ''."""
+        columns = lambda table: {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        if "run_id" not in columns("calls"):
+            conn.execute("ALTER TABLE calls ADD COLUMN run_id TEXT NOT NULL DEFAULT ''")
+        if "run_id" not in columns("outcomes"):
+            # La clave primaria cambia: hay que rehacer la tabla
+            conn.execute("ALTER TABLE outcomes RENAME TO outcomes_old")
+            conn.execute("""
+                CREATE TABLE outcomes (
+                    run_id TEXT NOT NULL DEFAULT '',
+                    iteration INTEGER NOT NULL,
+                    slot TEXT NOT NULL,
+                    prompt_hash TEXT NOT NULL,
+                    submitted INTEGER NOT NULL,
+                    resolved INTEGER NOT NULL,
+                    PRIMARY KEY (run_id, iteration, slot)
+                )
+            """)
+            conn.execute(
+                "INSERT INTO outcomes (iteration, slot, prompt_hash, submitted, resolved)"
+                " SELECT iteration, slot, prompt_hash, submitted, resolved FROM outcomes_old"
+            )
+            conn.execute("DROP TABLE outcomes_old")
+
+    def _conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self.local.conn = conn
+        return conn
+
+    def record_call(self, role, model, prompt_tokens, completion_tokens, latency_s, estimated=False):
+        tags = _TAGS.get()
+        self._conn().execute(
+            "INSERT INTO calls (time, run_id, iteration, role, slot, prompt_hash, model, prompt_tokens,"
+            " completion_tokens, latency_s, estimated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), tags.get("run_id", _RUN_ID), tags.get("iteration", _ITERATION), role, tags.get("slot"),
+             tags.get("prompt_hash"), model, prompt_tokens, completion_tokens, latency_s, int(estimated))
+        )
+
+    def record_outcome(self, iteration, slot, prompt_hash, submitted, resolved, run_id=None):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO outcomes (run_id, iteration, slot, prompt_hash, submitted, resolved)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (_RUN_ID if run_id is None else run_id, iteration, slot, prompt_hash, submitted, resolved)
+        )
+
+    def usage_by_role(self):
+        """Tokens y latencia por ejecución, iteración y rol."""
+        rows = self._conn().execute("""
+            SELECT run_id, iteration, role, COUNT(*) AS calls, SUM(prompt_tokens) AS prompt_tokens,
+                   SUM(completion_tokens) AS completion_tokens, AVG(latency_s) AS avg_latency_s
+            FROM calls GROUP BY run_id, iteration, role ORDER BY MIN(time), iteration, role
+        """).fetchall()
+        return [dict(row) for row in rows]
+
+    def efficiency_by_generation(self):
+        """
+        Por prompt de coder (hash): tokens de coder y de evaluador gastados con
+        él, instancias resueltas y resueltas por cada 1k tokens del coder.
+        Las llamadas del evaluador se atribuyen por (ejecución, iteración, slot).
+        """
+        rows = self._conn().execute("""
+            WITH tagged AS (
+                SELECT c.role, c.prompt_tokens + c.completion_tokens AS tokens,
+                       COALESCE(c.prompt_hash, o.prompt_hash) AS prompt_hash
+                FROM calls c LEFT JOIN outcomes o
+                    ON o.run_id = c.run_id AND o.iteration = c.iteration AND o.slot = c.slot
+            ),
+            spent AS (
+                SELECT prompt_hash,
+                       SUM(CASE WHEN role = 'coder' THEN tokens ELSE 0 END) AS coder_tokens,
+                       SUM(CASE WHEN role = 'evaluator' THEN tokens ELSE 0 END) AS evaluator_tokens
+                FROM tagged WHERE prompt_hash IS NOT NULL GROUP BY prompt_hash
+            ),
+            results AS (
+                SELECT prompt_hash, GROUP_CONCAT(DISTINCT slot) AS slots, COUNT(*) AS evaluations,
+                       SUM(submitted) AS submitted, SUM(resolved) AS resolved,
+                       MIN(iteration) AS first_iteration
+                FROM outcomes GROUP BY prompt_hash
+            )
+            SELECT r.prompt_hash, r.slots, r.first_iteration, r.evaluations, r.submitted, r.resolved,
+                   COALESCE(s.coder_tokens, 0) AS coder_tokens,
+                   COALESCE(s.evaluator_tokens, 0) AS evaluator_tokens
+            FROM results r LEFT JOIN spent s ON s.prompt_hash = r.prompt_hash
+            ORDER BY r.first_iteration, r.slots
+        """).fetchall()
+        generations = []
+        for row in rows:
+            row = dict(row)
+            row["resolved_per_1k_tokens"] = (
+                round(row["resolved"] * 1000 / row["coder_tokens"], 4) if row["coder_tokens"] else None
+            )
+            generations.append(row)
+        return generations
+
+
+_LEDGER = None
+_LEDGER_LOCK = threading.Lock()
+
+
+def get_usage_ledger():
+    """Registro del proceso en ENTROPY_USAGE_DB (por defecto usage.db)."""
+    global _LEDGER
+    with _LEDGER_LOCK:
+        if _LEDGER is None:
+            _LEDGER = UsageLedger(os.environ.get("ENTROPY_USAGE_DB", DEFAULT_USAGE_DB))
+        return _LEDGER
+
+
+def record_usage(role, model, usage, latency_s, prompt=None, completion=None):
+    """
+    Guarda una llamada. `usage` es resp.usage de OpenAI; si falta (streaming
+    cortado antes del final) se estima con ≈4 caracteres por token.
+    Un fallo del registro nunca interrumpe la llamada al modelo.
+    """
+    try:
+        if usage is not None:
+            get_usage_ledger().record_call(role, model, usage.prompt_tokens, usage.completion_tokens, latency_s)
+        else:
+            get_usage_ledger().record_call(
+                role, model, len(prompt or "") // 4, len(completion or "") // 4, latency_s, estimated=True
+            )
+    except Exception as e:
+        print(f"Usage ledger write failed: {e}")
+
+
+def record_outcomes(iteration, prompts, reports):
+    """`reports` es {slot: reporte de SWE-bench o None}."""
+    try:
+        ledger = get_usage_ledger()
+        for slot, report in reports.items():
+            if report is None:
+                continue
+            ledger.record_outcome(
+                iteration, slot, prompt_hash(prompts[slot]),
+                report.get("submitted_instances", 0), report.get("resolved_instances", 0)
+            )
+    except Exception as e:
+        print(f"Usage ledger write failed: {e}")
@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import threading
+
+from workqueue import get_work_queue, DEFAULT_VISIBILITY_TIMEOUT
+from eval_reports import load_report, log_path, report_path
+
+# ---------------------------------------------------------------------
+# WORKER: consume trabajos run_agent / swebench_eval de la cola
+# ---------------------------------------------------------------------
+# python worker.py --queue sqlite:///queue.db [--config cfg.json] [--kinds run_agent,swebench_eval]
+#
+# --config es el mismo JSON que `cli.py run`: modelos por rol, límites de
+# rpm/tpm y eval_workers valen igual en los workers que en el proceso del grafo.
+
+MAX_LOG_CHARS = 200000
+
+_INSTANCES = {}
+
+
+def get_instance(instance_id):
+    """Instancia de SWE-bench Lite (cacheada por proceso)."""
+    if instance_id not in _INSTANCES:
+        from tool import load_problem
+        for instance in load_problem([instance_id]):
+            _INSTANCES[instance["instance_id"]] = instance
+    return _INSTANCES[instance_id]
+
+
+def handle_run_agent(payload):
+    from tool import generate_patch
+    from usage import usage_tags, prompt_hash
+
+    instance = get_instance(payload["instance_id"])
+    tags = {"slot": payload["model"], "prompt_hash": prompt_hash(payload["prompt"]), "iteration": payload.get("iteration", 0)}
+    if payload.get("usage_run_id"):
+        tags["run_id"] = payload["usage_run_id"]
+    with usage_tags(**tags):
+        generated = generate_patch(
+            instance,
+            payload["prompt"],
+            payload.get("context_budget"),
+            payload.get("stream", False),
+            payload.get("n_samples", 1),
+        )
+    return {
+        "instance_id": payload["instance_id"],
+        "model_patch": generated["model_patch"],
+        "model_name_or_path": payload["model"],
+        "stream_stats": generated.get("stream_stats"),
+        "candidates": generated.get("candidates"),
+    }
+
+
+def handle_swebench_eval(payload):
+    """Evalúa una sola predicción con un run_id propio y devuelve el reporte y el log."""
+    from tool import run_swebench_eval
+
+    model = payload["model"]
+    instance_id = payload["prediction"]["instance_id"]
+    run_id = payload["run_id"]
+
+    os.makedirs("predictions/jobs", exist_ok=True)
+    path = f"predictions/jobs/{model}.{instance_id}.json"
+    with open(path, "w") as f:
+        json.dump([payload["prediction"]], f)
+    if payload.get("fail_fast"):
+        from failfast import run_fail_fast_eval
+        run_fail_fast_eval(path, [get_instance(instance_id)], run_id=run_id)
+    else:
+        run_swebench_eval(path, run_id=run_id)
+
+    log = None
+    if os.path.exists(log_path(model, instance_id, run_id)):
+        with open(log_path(model, instance_id, run_id), "r") as f:
+            log = f.read()[:MAX_LOG_CHARS]
+    report = load_report(model, run_id)
+    remove_job_files(model, run_id, path)
+    return {"instance_id": instance_id, "report": report, "log": log}
+
+
+def remove_job_files(model, run_id, path):
+    """
+    Borra lo que deja una evaluación con run_id propio: el reporte y el log
+    ya van en el resultado del trabajo, y sin esto se acumulan en el worker.
+    """
+    from failfast import DATASET_DIR, F2P_SUFFIX
+
+    files = [path, report_path(model, run_id), report_path(model, run_id + F2P_SUFFIX)]
+    files += [f"{DATASET_DIR}/{model}.{run_id}.{suffix}.json" for suffix in ("dataset", "f2p", "promising")]
+    for file in files:
+        if os.path.exists(file):
+            os.remove(file)
+    for logs in (run_id, run_id + F2P_SUFFIX):
+        shutil.rmtree(f"logs/run_evaluation/{logs}", ignore_errors=True)
+
+
+def handle_echo(payload):
+    """Trabajo trivial para probar la cola con varios workers locales."""
+    time.sleep(payload.get("sleep", 0))
+    return {"echo": payload, "pid": os.getpid()}
+
+
+HANDLERS = {
+    "run_agent": handle_run_agent,
+    "swebench_eval": handle_swebench_eval,
+    "echo": handle_echo,
+}
+
+
+def _keep_lease(queue, job, worker_id, visibility_timeout, stop):
+    while not stop.wait(visibility_timeout / 3):
+        if not queue.heartbeat(job["id"], worker_id, visibility_timeout):
+            return
+
+
+def run_worker(queue_url, kinds=None, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT, poll_interval=2, exit_when_idle=None):
+    queue = get_work_queue(queue_url)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    kinds = kinds or list(HANDLERS)
+    print(f"Worker {worker_id} consuming {kinds} from {queue_url}")
+
+    idle_since = time.time()
+    while True:
+        job = queue.lease(worker_id, kinds, visibility_timeout)
+        if job is None:
+            if exit_when_idle is not None and time.time() - idle_since > exit_when_idle:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_keep_lease, args=(queue, job, worker_id, visibility_timeout, stop), daemon=True)
+        heartbeat.start()
+        try:
+            result = HANDLERS[job["kind"]](job["payload"])
+        except Exception as e:
+            print(f"Job {job['id']} ({job['kind']}) failed: {e}")
+            queue.fail(job["id"], worker_id, str(e))
+        else:
+            if not queue.ack(job["id"], worker_id, result):
+                print(f"Job {job['id']} lease was lost, result discarded.")
+        finally:
+            stop.set()
+        idle_since = time.time()
+
+
+def check_queue(n_workers=4, n_jobs=20, timeout=120):
+    """
+    Prueba de extremo a extremo con procesos locales: n_workers procesos de
+    worker.py vacían un grupo de trabajos echo. Devuelve True si todos
+    terminaron en 'done' y los repartieron más de un proceso.
+    """
+    import tempfile
+    import subprocess
+
+    with tempfile.TemporaryDirectory() as tmp:
+        queue_url = "sqlite:///" + os.path.join(tmp, "queue.db")
+        queue = get_work_queue(queue_url)
+        for i in range(n_jobs):
+            queue.enqueue("check", "echo", {"i": i, "sleep": 0.2})
+
+        workers = [
+            subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--queue", queue_url, "--kinds", "echo",
+                 "--poll-interval", "0.1", "--exit-when-idle", "2"],
+                stdout=subprocess.DEVNULL
+            )
+            for _ in range(n_workers)
+        ]
+        try:
+            jobs = queue.wait_group("check", poll_interval=0.2, timeout=timeout)
+        finally:
+            for process in workers:
+                process.wait(timeout=30)
+
+    done = [job for job in jobs if job["status"] == "done"]
+    pids = {job["result"]["pid"] for job in done}
+    payloads = sorted(job["result"]["echo"]["i"] for job in done)
+    ok = len(done) == n_jobs and payloads == list(range(n_jobs)) and len(pids) > 1
+    print(f"Queue check: {len(done)}/{n_jobs} done by {len(pids)} worker processes -> {'OK' if ok else 'FAILED'}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="EntropyEvolve queue worker")
+    parser.add_argument("--queue", default=os.environ.get("ENTROPY_QUEUE", "sqlite:///queue.db"))
+    parser.add_argument("--config", default=os.environ.get("ENTROPY_CONFIG"), help="JSON config file (models, concurrency)")
+    parser.add_argument("--kinds", default=None, help="Comma separated job kinds (default: all)")
+    parser.add_argument("--visibility-timeout", type=float, default=DEFAULT_VISIBILITY_TIMEOUT)
+    parser.add_argument("--poll-interval", type=float, default=2)
+    parser.add_argument("--exit-when-idle", type=float, default=None, help="Exit after this many idle seconds")
+    args = parser.parse_args(argv)
+
+    from config import load_config, validate_config, apply_config
+
+    config = load_config(args.config)
+    errors = validate_config(config)
+    if errors:
+        for error in errors:
+            print(f"config error: {error}", file=sys.stderr)
+        return 2
+    apply_config(config)
+
+    run_worker(
+        args.queue,
+        kinds=args.kinds.split(",") if args.kinds else None,
+        visibility_timeout=args.visibility_timeout,
+        poll_interval=args.poll_interval,
+        exit_when_idle=args.exit_when_idle,
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import json
+import time
+import sqlite3
+import threading
+
+# ---------------------------------------------------------------------
+# COLA DE TRABAJOS CON LEASE / ACK
+# ---------------------------------------------------------------------
+# El proceso del grafo encola un trabajo por (agente, instancia) y los
+# workers (worker.py) los toman con un lease. Si un worker muere, el lease
+# caduca tras visibility_timeout y otro worker vuelve a tomar el trabajo.
+
+DEFAULT_VISIBILITY_TIMEOUT = 1800
+MAX_ATTEMPTS = 3
+
+
+class SQLiteQueue:
+    """
+    Cola sobre un archivo SQLite local. Solo para workers en el mismo host:
+    usa journal_mode=WAL, que no funciona sobre sistemas de archivos de red
+    (NFS, SMB). Para varias máquinas hace falta otro backend en QUEUE_BACKENDS.
+    """
+
+    def __init__(self, path, max_attempts=MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    group_id TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    result TEXT,
+                    error TEXT,
+                    created REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, kind)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_group ON jobs (group_id)")
+
+    def _connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self.local.conn = conn
+        return _Transaction(conn)
+
+    def enqueue(self, group_id, kind, payload):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (group_id, kind, payload, created) VALUES (?, ?, ?, ?)",
+                (group_id, kind, json.dumps(payload), time.time())
+            )
+            return cursor.lastrowid
+
+    def lease(self, worker_id, kinds=None, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        """Toma el trabajo más antiguo disponible (o con lease caducado). None si no hay."""
+        now = time.time()
+        kind_filter = ""
+        params = [now, self.max_attempts]
+        if kinds:
+            kind_filter = f" AND kind IN ({','.join('?' * len(kinds))})"
+            params.extend(kinds)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = 'queued' OR (status = 'leased' AND lease_expires < ?))"
+                " AND attempts < ?" + kind_filter + " ORDER BY id LIMIT 1",
+                params
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1"
+                " WHERE id = ?",
+                (worker_id, now + visibility_timeout, row["id"])
+            )
+        return {"id": row["id"], "group_id": row["group_id"], "kind": row["kind"],
+                "payload": json.loads(row["payload"]), "attempts": row["attempts"] + 1}
+
+    def heartbeat(self, job_id, worker_id, visibility_timeout=DEFAULT_VISIBILITY_TIMEOUT):
+        """Extiende el lease; False si el trabajo ya no pertenece a este worker."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (time.time() + visibility_timeout, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def ack(self, job_id, worker_id, result):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, lease_expires = NULL"
+                " WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (json.dumps(result), job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, worker_id, error):
+        """Devuelve el trabajo a la cola, o lo marca 'failed' si agotó los intentos."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,"
+                " error = ?, lease_owner = NULL, lease_expires = NULL"
+                " WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (self.max_attempts, error, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def group_status(self, group_id):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT status, COUNT(*) AS n FROM jobs WHERE group_id = ? GROUP BY status",
+                (group_id,)
+            ).fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def group_results(self, group_id):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM jobs WHERE group_id = ? ORDER BY id", (group_id,)).fetchall()
+        return [{
+            "id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "payload": json.loads(row["payload"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+        } for row in rows]
+
+    def expire_exhausted(self, group_id):
+        """Marca 'failed' los leases caducados que ya no tienen intentos."""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = COALESCE(error, 'lease expired')"
+                " WHERE group_id = ? AND status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (group_id, time.time(), self.max_attempts)
+            )
+
+    def wait_group(self, group_id, poll_interval=5, timeout=None):
+        """Bloquea hasta que todos los trabajos del grupo estén 'done' o 'failed'."""
+        start = time.time()
+        while True:
+            self.expire_exhausted(group_id)
+            counts = self.group_status(group_id)
+            pending = counts.get("queued", 0) + counts.get("leased", 0)
+            if pending == 0:
+                return self.group_results(group_id)
+            if timeout is not None and time.time() - start > timeout:
+                raise TimeoutError(f"Group {group_id} still has {pending} pending jobs")
+            time.sleep(poll_interval)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE / COMMIT sobre una conexión en modo autocommit."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+QUEUE_BACKENDS = {
+    "sqlite": SQLiteQueue,
+}
+
+
+def get_work_queue(url):
+    """Crea la cola a partir de una URL del tipo 'sqlite:///ruta/queue.db'."""
+    scheme, _, location = url.partition("://")
+    if scheme not in QUEUE_BACKENDS:
+        raise ValueError(f"Unknown work queue backend: {scheme}")
+    return QUEUE_BACKENDS[scheme](location[1:] if location.startswith("/") else location)